@@ -1,9 +1,28 @@
 from .voice_service import (
     text_to_speech,
     speech_to_text_from_bytes,
+    text_to_speech_async,
+    speech_to_text_from_bytes_async,
+    get_tts_metrics,
 )
+from .http_client import get_http_client, close_http_client
+from .tts_pool import TTSConnectionPool, get_tts_pool, close_tts_pool
+from .stt_stream import StreamingTranscriber, Endpointer
+from .tts_cache import TTSAudioCache, get_tts_cache
 
 __all__ = [
     "text_to_speech",
     "speech_to_text_from_bytes",
+    "text_to_speech_async",
+    "speech_to_text_from_bytes_async",
+    "get_http_client",
+    "close_http_client",
+    "get_tts_metrics",
+    "TTSConnectionPool",
+    "get_tts_pool",
+    "close_tts_pool",
+    "StreamingTranscriber",
+    "Endpointer",
+    "TTSAudioCache",
+    "get_tts_cache",
 ]
@@ -0,0 +1,311 @@
+"""
+Chunking of streamed LLM text for TTS.
+
+The first clause is flushed as soon as it ends, or at a word boundary once
+enough text or time has gone by without one, so audio starts early. After
+that, text is merged into sentence-sized chunks, which give better prosody
+and far fewer WebSocket messages. Splits
+never fall inside a word, so email addresses, "9:00 AM", abbreviations like
+"Dr." and decimals stay intact.
+
+    python chunking.py    # micro-benchmark against the old word splitter
+"""
+
+import os
+import re
+import time
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+
+TTS_CHUNK_FIRST_MIN_CHARS = int(os.getenv("TTS_CHUNK_FIRST_MIN_CHARS", 4))
+TTS_CHUNK_FIRST_MAX_CHARS = int(os.getenv("TTS_CHUNK_FIRST_MAX_CHARS", 40))
+TTS_CHUNK_FIRST_MAX_WAIT_MS = int(os.getenv("TTS_CHUNK_FIRST_MAX_WAIT_MS", 60))
+TTS_CHUNK_MIN_CHARS = int(os.getenv("TTS_CHUNK_MIN_CHARS", 80))
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", 250))
+TTS_CHUNK_MAX_WAIT_MS = int(os.getenv("TTS_CHUNK_MAX_WAIT_MS", 600))
+
+# Words ending in "." that do not end a sentence. Abbreviations that are
+# also everyday words ("Sun.", "Wed.", "Jan.") are left out.
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "approx",
+    "nr", "tel", "e.g", "i.e", "a.m", "p.m", "ca", "bzw", "usw", "z.b",
+    "feb", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "mon", "tue", "thu", "fri",
+}
+# Abbreviations only when a number follows, as in "No. 5"
+NUMBER_ABBREVIATIONS = {"no"}
+
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)")
+CLAUSE_END = re.compile(r"(?:[,;:]|—|–)[\"')\]]*(?=\s)|\s[—–-](?=\s)")
+TIME_TOKEN = re.compile(r"^\d{1,2}(?::\d{2})?$")
+# ", ; : ! ?" right after a word at the end of the buffer. Unlike ".", these
+# never continue a token (abbreviation, decimal, email), so need no lookahead.
+TRAILING_CLAUSE_END = re.compile(r"[^\W\d_][,;:!?][\"')\]]*$")
+MERIDIEM_TOKEN = re.compile(r"^(?:am|pm|a\.m\.?|p\.m\.?|o'?clock)\b", re.IGNORECASE)
+
+
+def _is_sentence_end(text: str, end: int) -> bool:
+    punctuation = text[:end].rstrip("\"')]")
+    if not punctuation.endswith(".") or punctuation.endswith(".."):
+        return True
+    word = re.search(r"(\S*)\.$", punctuation).group(1)
+    bare = word.lstrip("\"'([").lower()
+    if bare in ABBREVIATIONS:
+        return False
+    if bare in NUMBER_ABBREVIATIONS:
+        following = text[end:].lstrip()
+        # Undecided until the next word is visible
+        return bool(following) and not following[0].isdigit()
+    # Initials like "J." in "J. Smith"
+    return not re.fullmatch(r"[a-z]", bare)
+
+
+def sentence_boundaries(text: str) -> List[int]:
+    """Offsets just after each sentence-final punctuation mark followed by whitespace."""
+    return [m.end() for m in SENTENCE_END.finditer(text) if _is_sentence_end(text, m.end())]
+
+
+def clause_boundaries(text: str) -> List[int]:
+    boundaries = [m.end() for m in CLAUSE_END.finditer(text)]
+    return sorted(set(boundaries + sentence_boundaries(text)))
+
+
+def word_boundaries(text: str) -> List[int]:
+    """
+    Whitespace where a split is safe. The next word must already be visible,
+    so a time is never separated from the "AM" that may still be on its way.
+    """
+    boundaries = []
+    for match in re.finditer(r"\s+", text):
+        start, end = match.span()
+        if start == 0 or end == len(text):
+            continue
+        previous_word = text[:start].rsplit(None, 1)[-1]
+        if TIME_TOKEN.match(previous_word) and MERIDIEM_TOKEN.match(text[end:]):
+            continue
+        boundaries.append(start)
+    return boundaries
+
+
+def split_first_sentence(text: str) -> Tuple[str, Optional[str]]:
+    """(first sentence, rest) if text holds a complete sentence, else (text, None)."""
+    boundaries = sentence_boundaries(text)
+    if not boundaries:
+        return text, None
+    return text[:boundaries[0]], text[boundaries[0]:].lstrip()
+
+
+class ChunkingPolicy:
+
+    def __init__(
+        self,
+        first_min_chars: int = TTS_CHUNK_FIRST_MIN_CHARS,
+        first_max_chars: int = TTS_CHUNK_FIRST_MAX_CHARS,
+        first_max_wait_ms: int = TTS_CHUNK_FIRST_MAX_WAIT_MS,
+        min_chars: int = TTS_CHUNK_MIN_CHARS,
+        max_chars: int = TTS_CHUNK_MAX_CHARS,
+        max_wait_ms: int = TTS_CHUNK_MAX_WAIT_MS
+    ):
+        self.first_min_chars = first_min_chars
+        self.first_max_chars = first_max_chars
+        self.first_max_wait_ms = first_max_wait_ms
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.max_wait_ms = max_wait_ms
+
+    def max_wait(self, first: bool) -> float:
+        return (self.first_max_wait_ms if first else self.max_wait_ms) / 1000
+
+    def find_cut(self, text: str, first: bool, waited: float) -> Optional[int]:
+        """Where to end the next chunk, or None to keep buffering."""
+        if first:
+            ends = clause_boundaries(text)
+            if TRAILING_CLAUSE_END.search(text):
+                ends.append(len(text))
+            for end in ends:
+                if end >= self.first_min_chars:
+                    return end
+            if len(text) >= self.first_max_chars or waited >= self.max_wait(first):
+                # Nothing clause-shaped yet; any whole word beats silence
+                words = word_boundaries(text)
+                return words[-1] if words else None
+            return None
+
+        sentences = sentence_boundaries(text)
+        if sentences and sentences[-1] >= self.min_chars:
+            return sentences[-1]
+
+        if len(text) >= self.max_chars:
+            candidates = [end for end in clause_boundaries(text) if end <= self.max_chars]
+            candidates = candidates or [end for end in word_boundaries(text) if end <= self.max_chars]
+            return candidates[-1] if candidates else None
+
+        if waited >= self.max_wait(first):
+            # The model stalled, e.g. before a tool call; speak what is complete
+            if sentences:
+                return sentences[-1]
+            clauses = clause_boundaries(text)
+            return clauses[-1] if clauses else None
+
+        return None
+
+
+DEFAULT_CHUNKING_POLICY = ChunkingPolicy()
+
+
+async def text_chunker(
+    chunks: AsyncIterator[str],
+    policy: Optional[ChunkingPolicy] = None
+) -> AsyncIterator[str]:
+    """Re-chunk streamed deltas by the policy. Every chunk ends with a space, as ElevenLabs expects."""
+
+    policy = policy or DEFAULT_CHUNKING_POLICY
+    iterator = chunks.__aiter__()
+    buffer = ""
+    first = True
+    # The first chunk's wait runs from its first text; later ones from the
+    # last delta, so only a real stall flushes a short sentence
+    first_text_at = None
+    last_text_at = None
+    next_delta: Optional[asyncio.Future] = None
+    exhausted = False
+
+    def waited() -> float:
+        return time.monotonic() - (first_text_at if first else last_text_at)
+
+    try:
+        while not exhausted:
+            if next_delta is None:
+                next_delta = asyncio.ensure_future(iterator.__anext__())
+
+            timeout = None
+            if buffer.strip():
+                remaining = policy.max_wait(first) - waited()
+                # Once overdue the buffer was already checked; only new text can help
+                timeout = remaining if remaining > 0 else None
+
+            # asyncio.wait does not cancel the pending delta on timeout
+            done, _ = await asyncio.wait({next_delta}, timeout=timeout)
+
+            if next_delta in done:
+                try:
+                    delta = next_delta.result() or ""
+                except StopAsyncIteration:
+                    exhausted = True
+                    delta = ""
+                next_delta = None
+                buffer += delta
+                if delta.strip():
+                    last_text_at = time.monotonic()
+                    first_text_at = first_text_at or last_text_at
+
+            while not exhausted and buffer.strip():
+                cut = policy.find_cut(buffer, first, waited())
+                if not cut:
+                    break
+                chunk, buffer = buffer[:cut].strip(), buffer[cut:].lstrip()
+                if chunk:
+                    yield chunk + " "
+                    first = False
+
+        if buffer.strip():
+            yield buffer.strip() + " "
+
+    finally:
+        if next_delta is not None and not next_delta.done():
+            next_delta.cancel()
+
+
+async def _legacy_text_chunker(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """The previous splitter, kept only as the benchmark baseline."""
+
+    splitters = (".", ",", "?", "!", ";", ":", "—", "-", "(", ")", "[", "]", "}", " ")
+    buffer = ""
+
+    async for text in chunks:
+        if not text:
+            continue
+
+        if buffer.endswith(splitters):
+            yield buffer + " "
+            buffer = text
+        elif text.startswith(splitters):
+            output = buffer + text[0] + " "
+            yield output
+            buffer = text[1:]
+        else:
+            buffer += text
+
+    if buffer:
+        yield buffer + " "
+
+
+BENCHMARK_REPLIES = [
+    "Checking now. I have December 5th at 9:00 AM or 2:00 PM, and December 6th at 10:00 AM. Which one works for you?",
+    "Got it, that's krrish.mof07@gmail.com, correct?",
+    "Sending your confirmation now. Check your email at anna.mueller@example.de and click the link within 30 minutes to secure your spot, e.g. before 3 p.m. today.",
+    "Dr. Weber's office at St. Anna Str. 12 handles residence permits. Please bring your passport, your rental contract and a biometric photo. The fee is approx. 100.50 euros.",
+]
+
+
+async def _tokens(text: str, delay: float) -> AsyncIterator[str]:
+    # Roughly what a streaming completion looks like: ~4-character deltas
+    for token in re.findall(r"\s*\S{1,4}", text):
+        await asyncio.sleep(delay)
+        yield token
+
+
+async def _measure(chunker, text: str, delay: float) -> Tuple[List[str], float]:
+    started = time.perf_counter()
+    first_chunk_at = None
+    chunks = []
+    async for chunk in chunker(_tokens(text, delay)):
+        if first_chunk_at is None:
+            first_chunk_at = time.perf_counter() - started
+        chunks.append(chunk)
+    return chunks, first_chunk_at * 1000
+
+
+def _splits_inside(chunks: List[str], *phrases: str) -> List[str]:
+    """Phrases that do not appear whole in any single chunk."""
+    return [phrase for phrase in phrases if not any(phrase in chunk for chunk in chunks)]
+
+
+async def test_text_chunker(token_delay: float = 0.02):
+    """Chunk count, time to first chunk and split correctness, old splitter vs new."""
+
+    print(f"{'reply':>5} {'chunker':>8} {'chunks':>7} {'first ms':>9} {'avg chars':>10}")
+    totals = {"legacy": [0, 0.0], "policy": [0, 0.0]}
+
+    for number, reply in enumerate(BENCHMARK_REPLIES, 1):
+        for name, chunker in (("legacy", _legacy_text_chunker), ("policy", text_chunker)):
+            chunks, first_ms = await _measure(chunker, reply, token_delay)
+            totals[name][0] += len(chunks)
+            totals[name][1] += first_ms
+            average = sum(len(chunk) for chunk in chunks) / len(chunks)
+            print(f"{number:>5} {name:>8} {len(chunks):>7} {first_ms:>9.0f} {average:>10.1f}")
+
+        chunks, _ = await _measure(text_chunker, reply, 0)
+        broken = _splits_inside(
+            chunks,
+            *re.findall(r"\d{1,2}:\d{2} [AP]M|\S+@\S+\.\w+|Dr\. \w+|St\. \w+|e\.g\. \w+|\d+\.\d+", reply)
+        )
+        assert "".join(chunks).split() == reply.split(), "text changed"
+        assert not broken, f"split inside {broken}"
+
+    for text, expected in (
+        ("Is that a yes or no. Next, your name. ", ["Is that a yes or no.", "Next, your name."]),
+        ("Booking No. 5 is at 9:00. See you Sun. ", ["Booking No. 5 is at 9:00.", "See you Sun."]),
+    ):
+        sentences, start = [], 0
+        for end in sentence_boundaries(text):
+            sentences.append(text[start:end].strip())
+            start = end
+        assert sentences == expected, f"sentences {sentences}"
+
+    for name, (count, first_ms) in totals.items():
+        print(f"{name}: {count} chunks in total, {first_ms / len(BENCHMARK_REPLIES):.0f} ms to first chunk on average")
+
+
+if __name__ == "__main__":
+    asyncio.run(test_text_chunker())
@@ -0,0 +1,73 @@
+""" Shared, pooled HTTP client for the ElevenLabs REST endpoints."""
+
+import os
+import asyncio
+import threading
+import weakref
+from typing import Optional, Coroutine, Any
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ELEVENLABS_HTTP_TIMEOUT = float(os.getenv("ELEVENLABS_HTTP_TIMEOUT", 30))
+ELEVENLABS_HTTP_CONNECT_TIMEOUT = float(os.getenv("ELEVENLABS_HTTP_CONNECT_TIMEOUT", 5))
+ELEVENLABS_HTTP_MAX_CONNECTIONS = int(os.getenv("ELEVENLABS_HTTP_MAX_CONNECTIONS", 20))
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# httpx clients are bound to the loop they were first used on
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(ELEVENLABS_HTTP_TIMEOUT, connect=ELEVENLABS_HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=ELEVENLABS_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=ELEVENLABS_HTTP_MAX_CONNECTIONS
+        )
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Keep-alive client for the running event loop."""
+    loop = asyncio.get_running_loop()
+
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = create_http_client()
+        _clients[loop] = client
+
+    return client
+
+
+async def close_http_client():
+    loop = asyncio.get_running_loop()
+
+    client = _clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """
+    Run a coroutine from sync code on a long-lived background loop, so the
+    sync wrappers reuse pooled connections too.
+    """
+    global _sync_loop
+
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, daemon=True).start()
+
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
@@ -0,0 +1,304 @@
+"""
+Streaming speech-to-text for audio sent over the app's WebSocket.
+
+The browser sends 16 kHz mono PCM16 frames. They are forwarded to an STT
+backend as they arrive, and a local energy endpointer decides when the
+caller has finished. Events go to a callback:
+
+    {"type": "speech_start"}                 the caller started talking (barge-in)
+    {"type": "partial", "text": ...}         while the caller speaks
+    {"type": "stable_partial", "text": ...}  caller paused and the text stopped changing
+    {"type": "final", "text": ...}           endpoint reached, committed transcript
+
+A stable partial arrives before the endpoint silence has fully elapsed and
+before the final transcript comes back, so the agent can start on it.
+"""
+
+import os
+import io
+import json
+import math
+import time
+import wave
+import array
+import base64
+import asyncio
+from collections import deque
+from typing import Dict, Any, Optional, Callable, Awaitable
+import websockets
+from dotenv import load_dotenv
+
+from .voice_service import speech_to_text_from_bytes_async, ELEVENLABS_API_KEY
+
+load_dotenv()
+
+# "realtime" streams to the ElevenLabs realtime STT socket, "batch" re-transcribes
+# the utterance so far over REST (works with any speech-to-text model)
+STT_STREAM_BACKEND = os.getenv("STT_STREAM_BACKEND", "realtime").lower()
+STT_REALTIME_MODEL = os.getenv("ELEVENLABS_STT_REALTIME_MODEL", "scribe_v2_realtime")
+STT_REALTIME_URL = os.getenv("ELEVENLABS_STT_REALTIME_URL", "wss://api.elevenlabs.io/v1/speech-to-text/realtime")
+STT_SAMPLE_RATE = int(os.getenv("STT_SAMPLE_RATE", 16000))
+
+STT_VAD_RMS_THRESHOLD = float(os.getenv("STT_VAD_RMS_THRESHOLD", 500))
+STT_MIN_SPEECH_MS = int(os.getenv("STT_MIN_SPEECH_MS", 120))
+# Audio kept from before speech was detected, so the first syllable is not cut
+STT_PREROLL_MS = int(os.getenv("STT_PREROLL_MS", 300))
+STT_ENDPOINT_SILENCE_MS = int(os.getenv("STT_ENDPOINT_SILENCE_MS", 700))
+STT_STABLE_PARTIAL_MS = int(os.getenv("STT_STABLE_PARTIAL_MS", 300))
+STT_BATCH_PARTIAL_INTERVAL_MS = int(os.getenv("STT_BATCH_PARTIAL_INTERVAL_MS", 1000))
+
+TranscriptCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def pcm16_rms(frame: bytes) -> float:
+    samples = array.array("h")
+    samples.frombytes(frame[:len(frame) - len(frame) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+def pcm16_to_wav(pcm: bytes, sample_rate: int = STT_SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class Endpointer:
+    """Energy-based voice activity over PCM16 frames, measured in audio time."""
+
+    def __init__(
+        self,
+        sample_rate: int = STT_SAMPLE_RATE,
+        threshold: float = STT_VAD_RMS_THRESHOLD,
+        min_speech_ms: int = STT_MIN_SPEECH_MS,
+        endpoint_silence_ms: int = STT_ENDPOINT_SILENCE_MS
+    ):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.min_speech_ms = min_speech_ms
+        self.endpoint_silence_ms = endpoint_silence_ms
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self.speech_ms = 0.0
+        self.silence_ms = 0.0
+
+    def process(self, frame: bytes) -> Optional[str]:
+        """Returns "speech_start", "endpoint" or None for this frame."""
+        frame_ms = len(frame) / 2 / self.sample_rate * 1000
+
+        if pcm16_rms(frame) >= self.threshold:
+            self.speech_ms += frame_ms
+            self.silence_ms = 0.0
+            if not self.in_speech and self.speech_ms >= self.min_speech_ms:
+                self.in_speech = True
+                return "speech_start"
+            return None
+
+        self.silence_ms += frame_ms
+        if not self.in_speech:
+            # Short noise bursts do not count as speech
+            self.speech_ms = 0.0
+            return None
+
+        if self.silence_ms >= self.endpoint_silence_ms:
+            self.reset()
+            return "endpoint"
+        return None
+
+
+class RealtimeSTTBackend:
+    """ElevenLabs realtime STT socket, committed manually at our endpoint."""
+
+    def __init__(self, on_transcript: Callable[[str, str], Awaitable[None]]):
+        self.on_transcript = on_transcript
+        self.websocket = None
+        self._reader_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        uri = (
+            f"{STT_REALTIME_URL}?model_id={STT_REALTIME_MODEL}"
+            f"&audio_format=pcm_{STT_SAMPLE_RATE}&commit_strategy=manual"
+        )
+        # websockets renamed extra_headers to additional_headers in 13.0
+        try:
+            self.websocket = await websockets.connect(uri, additional_headers={"xi-api-key": ELEVENLABS_API_KEY})
+        except TypeError:
+            self.websocket = await websockets.connect(uri, extra_headers={"xi-api-key": ELEVENLABS_API_KEY})
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            async for message in self.websocket:
+                data = json.loads(message)
+                message_type = data.get("message_type", "")
+                if message_type == "partial_transcript":
+                    await self.on_transcript("partial", data.get("text", ""))
+                elif message_type.startswith("committed_transcript"):
+                    await self.on_transcript("final", data.get("text", ""))
+                elif "error" in message_type:
+                    print(f"[ERROR] Realtime STT: {data}")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def send_audio(self, frame: bytes, commit: bool = False):
+        await self.websocket.send(json.dumps({
+            "message_type": "input_audio_chunk",
+            "audio_base_64": base64.b64encode(frame).decode(),
+            "commit": commit,
+            "sample_rate": STT_SAMPLE_RATE
+        }))
+
+    async def commit(self):
+        await self.send_audio(b"", commit=True)
+
+    async def close(self):
+        if self.websocket is not None:
+            try:
+                await self.websocket.close()
+            except Exception:
+                pass
+        if self._reader_task:
+            self._reader_task.cancel()
+
+
+class BatchSTTBackend:
+    """
+    Buffers the utterance and transcribes it over REST: the buffer so far at
+    most every STT_BATCH_PARTIAL_INTERVAL_MS for partials, the whole of it on
+    commit for the final.
+    """
+
+    def __init__(self, on_transcript: Callable[[str, str], Awaitable[None]]):
+        self.on_transcript = on_transcript
+        self._pcm = bytearray()
+        self._last_partial_at = 0.0
+        self._partial_task: Optional[asyncio.Task] = None
+        self._final_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        pass
+
+    async def _transcribe(self, pcm: bytes) -> str:
+        result = await speech_to_text_from_bytes_async(pcm16_to_wav(pcm), filename="utterance.wav")
+        return result.get("text", "").strip()
+
+    async def _partial(self, pcm: bytes):
+        text = await self._transcribe(pcm)
+        if text:
+            await self.on_transcript("partial", text)
+
+    async def send_audio(self, frame: bytes, commit: bool = False):
+        self._pcm.extend(frame)
+        now = time.monotonic()
+        partial_due = (now - self._last_partial_at) * 1000 >= STT_BATCH_PARTIAL_INTERVAL_MS
+        if partial_due and (self._partial_task is None or self._partial_task.done()):
+            self._last_partial_at = now
+            self._partial_task = asyncio.create_task(self._partial(bytes(self._pcm)))
+
+    async def _final(self, pcm: bytes):
+        await self.on_transcript("final", await self._transcribe(pcm) if pcm else "")
+
+    async def commit(self):
+        pcm, self._pcm = bytes(self._pcm), bytearray()
+        if self._partial_task and not self._partial_task.done():
+            self._partial_task.cancel()
+        # Off the receive path, audio keeps flowing while the final is transcribed
+        self._final_task = asyncio.create_task(self._final(pcm))
+
+    async def close(self):
+        for task in (self._partial_task, self._final_task):
+            if task:
+                task.cancel()
+
+
+STT_BACKENDS = {
+    "realtime": RealtimeSTTBackend,
+    "batch": BatchSTTBackend,
+}
+
+
+class StreamingTranscriber:
+    """One per WebSocket session: audio in, transcript events out."""
+
+    def __init__(self, on_event: TranscriptCallback, backend: str = STT_STREAM_BACKEND):
+        self.on_event = on_event
+        self.endpointer = Endpointer()
+        self.backend = STT_BACKENDS[backend](self._on_transcript)
+        self._partial = ""
+        self._partial_changed_ms = 0.0
+        self._stable_sent = False
+        self._utterance_started = False
+        self._preroll: deque = deque()
+        self._preroll_ms = 0.0
+
+    async def start(self):
+        await self.backend.start()
+
+    async def _on_transcript(self, kind: str, text: str):
+        text = text.strip()
+
+        if kind == "final":
+            self._partial = ""
+            self._stable_sent = False
+            if text:
+                await self.on_event({"type": "final", "text": text})
+            return
+
+        if text and text != self._partial:
+            self._partial = text
+            self._partial_changed_ms = self.endpointer.silence_ms
+            self._stable_sent = False
+            await self.on_event({"type": "partial", "text": text})
+
+    async def feed(self, frame: bytes):
+        event = self.endpointer.process(frame)
+
+        if event == "speech_start":
+            self._utterance_started = True
+            while self._preroll:
+                await self.backend.send_audio(self._preroll.popleft())
+            self._preroll_ms = 0.0
+            await self.on_event({"type": "speech_start"})
+
+        if self._utterance_started:
+            await self.backend.send_audio(frame)
+        else:
+            self._buffer_preroll(frame)
+
+        if self.endpointer.silence_ms == 0:
+            # Still talking, whatever the partial says now is not final
+            self._partial_changed_ms = 0.0
+
+        if event == "endpoint":
+            self._utterance_started = False
+            await self.backend.commit()
+            return
+
+        # Paused long enough and the transcript has stopped moving
+        silence_ms = self.endpointer.silence_ms
+        if (
+            self._partial
+            and not self._stable_sent
+            and self.endpointer.in_speech
+            and silence_ms >= STT_STABLE_PARTIAL_MS
+            and silence_ms - self._partial_changed_ms >= STT_STABLE_PARTIAL_MS
+        ):
+            self._stable_sent = True
+            await self.on_event({"type": "stable_partial", "text": self._partial})
+
+    def _buffer_preroll(self, frame: bytes):
+        self._preroll.append(frame)
+        self._preroll_ms += len(frame) / 2 / STT_SAMPLE_RATE * 1000
+        while len(self._preroll) > 1 and self._preroll_ms > STT_PREROLL_MS:
+            dropped = self._preroll.popleft()
+            self._preroll_ms -= len(dropped) / 2 / STT_SAMPLE_RATE * 1000
+
+    async def close(self):
+        await self.backend.close()
@@ -0,0 +1,291 @@
+"""
+Content-addressed cache of synthesized phrases.
+
+Audio is keyed on (text, voice_id, model, voice_settings), held in an
+in-memory LRU and persisted to a size-capped directory, so greetings,
+fillers and templated sentences are synthesized once and then played back
+with no TTS round-trip.
+"""
+
+import os
+import re
+import json
+import bisect
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", Path(__file__).parent.parent / "data" / "tts_cache"))
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 32 * 1024 * 1024))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", 256 * 1024 * 1024))
+# A live sentence is stored once it has been synthesized this many times
+TTS_CACHE_MIN_REPEATS = int(os.getenv("TTS_CACHE_MIN_REPEATS", 2))
+TTS_CACHE_MAX_PHRASE_CHARS = int(os.getenv("TTS_CACHE_MAX_PHRASE_CHARS", 200))
+
+# Fixed phrases worth having before the first call
+TTS_CACHE_PRELOAD = [
+    phrase.strip() for phrase in os.getenv(
+        "TTS_CACHE_PRELOAD",
+        "One moment please.|Checking now, please wait.|Which one works for you?"
+    ).split("|") if phrase.strip()
+]
+
+INDEX_FILE = "index.json"
+
+
+def normalize_phrase(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text: str, voice_id: str, model: str, voice_settings: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        [normalize_phrase(text), voice_id, model, voice_settings],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def voice_config_key(voice_id: str, model: str, voice_settings: Dict[str, Any]) -> str:
+    return json.dumps([voice_id, model, voice_settings], sort_keys=True)
+
+
+class TTSAudioCache:
+
+    def __init__(
+        self,
+        directory: Path = TTS_CACHE_DIR,
+        memory_max_bytes: int = TTS_CACHE_MEMORY_BYTES,
+        disk_max_bytes: int = TTS_CACHE_DISK_BYTES,
+        min_repeats: int = TTS_CACHE_MIN_REPEATS
+    ):
+        self.directory = Path(directory)
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.min_repeats = min_repeats
+
+        self._lock = threading.RLock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # key -> {"text", "config", "size"} for everything on disk
+        self._index: Dict[str, Dict[str, Any]] = {}
+        # voice config -> sorted phrase texts, for prefix lookups while text streams in
+        self._phrases: Dict[str, List[str]] = {}
+        self._repeats: "OrderedDict[str, int]" = OrderedDict()
+        self._loaded = False
+
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stored": 0, "bytes_served": 0}
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with open(self.directory / INDEX_FILE) as f:
+                    index = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                index = {}
+            self._index = {
+                key: entry for key, entry in index.items()
+                if (self.directory / f"{key}.mp3").exists()
+            }
+            for entry in self._index.values():
+                bisect.insort(self._phrases.setdefault(entry["config"], []), entry["text"])
+            self._loaded = True
+
+    def _write_index(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f"{INDEX_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.directory / INDEX_FILE)
+
+    def _remember(self, key: str, audio: bytes):
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def has_prefix(self, text: str, voice_id: str, model: str, voice_settings: Dict[str, Any]) -> bool:
+        """Whether some cached phrase starts with text, i.e. it is worth waiting for more."""
+        self._ensure_loaded()
+        prefix = normalize_phrase(text)
+        if not prefix:
+            return False
+        phrases = self._phrases.get(voice_config_key(voice_id, model, voice_settings), [])
+        position = bisect.bisect_left(phrases, prefix)
+        return position < len(phrases) and phrases[position].startswith(prefix)
+
+    def _get_memory(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                self.stats["bytes_served"] += len(audio)
+            elif key not in self._index:
+                self.stats["misses"] += 1
+            return audio
+
+    def _get_disk(self, key: str) -> Optional[bytes]:
+        path = self.directory / f"{key}.mp3"
+        try:
+            audio = path.read_bytes()
+            # mtime is the disk tier's LRU clock
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._drop(key)
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self._remember(key, audio)
+            self.stats["disk_hits"] += 1
+            self.stats["bytes_served"] += len(audio)
+        return audio
+
+    def get(self, text: str, voice_id: str, model: str, voice_settings: Dict[str, Any]) -> Optional[bytes]:
+        self._ensure_loaded()
+        key = cache_key(text, voice_id, model, voice_settings)
+        audio = self._get_memory(key)
+        if audio is None and key in self._index:
+            audio = self._get_disk(key)
+        return audio
+
+    async def get_async(self, text: str, voice_id: str, model: str, voice_settings: Dict[str, Any]) -> Optional[bytes]:
+        """Like get(), with the disk read off the event loop."""
+        self._ensure_loaded()
+        key = cache_key(text, voice_id, model, voice_settings)
+        audio = self._get_memory(key)
+        if audio is None and key in self._index:
+            audio = await asyncio.to_thread(self._get_disk, key)
+        return audio
+
+    def should_store(self, text: str, voice_id: str, model: str, voice_settings: Dict[str, Any]) -> bool:
+        """Count one live synthesis of text; True once it has recurred often enough."""
+        text = normalize_phrase(text)
+        if not text or len(text) > TTS_CACHE_MAX_PHRASE_CHARS:
+            return False
+        key = cache_key(text, voice_id, model, voice_settings)
+        with self._lock:
+            count = self._repeats.pop(key, 0) + 1
+            self._repeats[key] = count
+            while len(self._repeats) > 10000:
+                self._repeats.popitem(last=False)
+            return count >= self.min_repeats
+
+    def put(self, text: str, voice_id: str, model: str, voice_settings: Dict[str, Any], audio: bytes):
+        self._ensure_loaded()
+        text = normalize_phrase(text)
+        if not text or not audio:
+            return
+        key = cache_key(text, voice_id, model, voice_settings)
+        config = voice_config_key(voice_id, model, voice_settings)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f"{key}.mp3.tmp"
+        tmp_path.write_bytes(audio)
+        os.replace(tmp_path, self.directory / f"{key}.mp3")
+
+        with self._lock:
+            self._remember(key, audio)
+            if key not in self._index:
+                bisect.insort(self._phrases.setdefault(config, []), text)
+            self._index[key] = {"text": text, "config": config, "size": len(audio)}
+            self._repeats.pop(key, None)
+            self.stats["stored"] += 1
+            self._enforce_disk_cap()
+            self._write_index()
+
+    def _drop(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry:
+            phrases = self._phrases.get(entry["config"], [])
+            position = bisect.bisect_left(phrases, entry["text"])
+            if position < len(phrases) and phrases[position] == entry["text"]:
+                phrases.pop(position)
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+
+    def _enforce_disk_cap(self):
+        total = sum(entry["size"] for entry in self._index.values())
+        if total <= self.disk_max_bytes:
+            return
+
+        def last_used(key):
+            try:
+                return (self.directory / f"{key}.mp3").stat().st_mtime
+            except FileNotFoundError:
+                return 0.0
+
+        for key in sorted(self._index, key=last_used):
+            if total <= self.disk_max_bytes:
+                break
+            total -= self._index[key]["size"]
+            self._drop(key)
+            try:
+                (self.directory / f"{key}.mp3").unlink()
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._ensure_loaded()
+        with self._lock:
+            return dict(
+                self.stats,
+                memory_entries=len(self._memory),
+                memory_bytes=self._memory_bytes,
+                disk_entries=len(self._index),
+                disk_bytes=sum(entry["size"] for entry in self._index.values()),
+            )
+
+
+async def preload_phrases(
+    cache: "TTSAudioCache",
+    voice_id: str,
+    model: str,
+    voice_settings: Dict[str, Any],
+    phrases: List[str] = TTS_CACHE_PRELOAD
+) -> int:
+    """Synthesize the fixed phrases that are not cached yet. Returns how many were added."""
+    from .voice_service import text_to_speech_async
+
+    added = 0
+    for phrase in phrases:
+        if await cache.get_async(phrase, voice_id, model, voice_settings) is not None:
+            continue
+        audio = await text_to_speech_async(
+            phrase,
+            voice_id=voice_id,
+            model=model,
+            stability=voice_settings.get("stability", 0.5),
+            similarity_boost=voice_settings.get("similarity_boost", 0.75)
+        )
+        await asyncio.to_thread(cache.put, phrase, voice_id, model, voice_settings, audio)
+        added += 1
+    return added
+
+
+_tts_cache: Optional[TTSAudioCache] = None
+
+
+def get_tts_cache() -> TTSAudioCache:
+    global _tts_cache
+
+    if _tts_cache is None:
+        _tts_cache = TTSAudioCache()
+
+    return _tts_cache
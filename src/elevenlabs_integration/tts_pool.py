@@ -0,0 +1,387 @@
+"""
+Pool of warm ElevenLabs TTS WebSocket connections.
+
+Uses the multi-context endpoint so one socket can serve many turns: each
+reply gets its own context_id, and the socket (TLS + WebSocket handshake)
+is kept open and reused across turns and sessions.
+"""
+
+import os
+import asyncio
+import json
+import base64
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple, List, Set, Callable
+import websockets
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+
+# Per (voice, model) pool limits
+TTS_POOL_MAX_CONNECTIONS = int(os.getenv("TTS_POOL_MAX_CONNECTIONS", 4))
+TTS_POOL_MAX_CONTEXTS_PER_CONNECTION = int(os.getenv("TTS_POOL_MAX_CONTEXTS_PER_CONNECTION", 5))
+TTS_POOL_KEEPALIVE_INTERVAL = float(os.getenv("TTS_POOL_KEEPALIVE_INTERVAL", 15))
+TTS_POOL_INACTIVITY_TIMEOUT = int(os.getenv("TTS_POOL_INACTIVITY_TIMEOUT", 180))
+
+
+class TTSContext:
+    """One assistant reply streamed over a shared connection."""
+
+    def __init__(self, connection: "TTSConnection", context_id: str):
+        self.connection = connection
+        self.context_id = context_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def start(self, voice_settings: Dict[str, float]):
+        await self.connection.send({
+            "text": " ",
+            "voice_settings": voice_settings,
+            "xi_api_key": ELEVENLABS_API_KEY,
+            "context_id": self.context_id
+        })
+
+    async def send_text(self, text: str, flush: bool = False):
+        message = {"text": text, "context_id": self.context_id}
+        if flush:
+            message["flush"] = True
+        await self.connection.send(message)
+
+    async def end_input(self):
+        await self.connection.send({"context_id": self.context_id, "flush": True})
+        await self.connection.send({"context_id": self.context_id, "close_context": True})
+
+    async def abort(self):
+        """Stop generation for this context now, without flushing buffered text."""
+        await self.connection.send({"context_id": self.context_id, "close_context": True})
+
+    async def receive_audio(self, audio_callback: Callable[[bytes], None]):
+        while True:
+            data = await self.queue.get()
+
+            if data is None:
+                raise ConnectionError("TTS connection closed during streaming")
+
+            if data.get("audio"):
+                audio_chunk = base64.b64decode(data["audio"])
+                if asyncio.iscoroutinefunction(audio_callback):
+                    await audio_callback(audio_chunk)
+                else:
+                    audio_callback(audio_chunk)
+                print(f"[DEBUG] Received audio chunk: {len(audio_chunk)} bytes")
+
+            if data.get("isFinal"):
+                print("[INFO] Final audio chunk received")
+                break
+
+
+class TTSConnection:
+    """A single warm socket with a reader that routes frames by context id."""
+
+    def __init__(self, voice_id: str, model: str, metrics: "TTSPoolMetrics"):
+        self.voice_id = voice_id
+        self.model = model
+        self.metrics = metrics
+        self.websocket = None
+        self.contexts: Dict[str, TTSContext] = {}
+        self.last_used = time.monotonic()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def uri(self) -> str:
+        return (
+            f"wss://api.elevenlabs.io/v1/text-to-speech/{self.voice_id}/multi-stream-input"
+            f"?model_id={self.model}&inactivity_timeout={TTS_POOL_INACTIVITY_TIMEOUT}"
+        )
+
+    @property
+    def is_open(self) -> bool:
+        if self.websocket is None:
+            return False
+        # websockets >= 13 exposes state, older versions expose closed
+        closed = getattr(self.websocket, "closed", None)
+        if closed is not None:
+            return not closed
+        return self.websocket.state.name == "OPEN"
+
+    async def connect(self):
+        started = time.perf_counter()
+        self.websocket = await websockets.connect(self.uri)
+        self.metrics.record_handshake(time.perf_counter() - started)
+        self._reader_task = asyncio.create_task(self._read_loop())
+        print(f"[INFO] TTS pool connected ({self.voice_id}, {self.model})")
+
+    async def _read_loop(self):
+        try:
+            async for message in self.websocket:
+                data = json.loads(message)
+                context = self.contexts.get(data.get("contextId") or data.get("context_id"))
+                if context:
+                    context.queue.put_nowait(data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            # Wake up anyone still waiting on this socket
+            for context in self.contexts.values():
+                context.queue.put_nowait(None)
+
+    async def send(self, message: Dict[str, Any]):
+        async with self._send_lock:
+            await self.websocket.send(json.dumps(message))
+        self.last_used = time.monotonic()
+
+    def open_context(self) -> TTSContext:
+        context = TTSContext(self, uuid.uuid4().hex)
+        self.contexts[context.context_id] = context
+        return context
+
+    def release_context(self, context: TTSContext):
+        self.contexts.pop(context.context_id, None)
+        self.last_used = time.monotonic()
+
+    async def ping(self) -> bool:
+        try:
+            pong = await self.websocket.ping()
+            await asyncio.wait_for(pong, timeout=5)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        if self.websocket is not None:
+            try:
+                await self.websocket.close()
+            except Exception:
+                pass
+        if self._reader_task:
+            self._reader_task.cancel()
+
+
+class TTSPoolMetrics:
+
+    def __init__(self):
+        self.handshakes = 0
+        self.handshake_seconds = 0.0
+        self.reuses = 0
+        self.reconnects = 0
+        # Acquires that found every context slot taken and had to wait
+        self.waits = 0
+
+    def record_handshake(self, seconds: float):
+        self.handshakes += 1
+        self.handshake_seconds += seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        average = self.handshake_seconds / self.handshakes if self.handshakes else 0.0
+        return {
+            "handshakes": self.handshakes,
+            "reuses": self.reuses,
+            "reconnects": self.reconnects,
+            "waits": self.waits,
+            "avg_handshake_ms": round(average * 1000, 1),
+            # Every reuse is a handshake we did not have to pay for
+            "handshake_ms_saved": round(self.reuses * average * 1000, 1),
+        }
+
+
+class TTSConnectionPool:
+    """Warm connections keyed by (voice_id, model), health-checked in the background."""
+
+    def __init__(
+        self,
+        max_connections: int = TTS_POOL_MAX_CONNECTIONS,
+        max_contexts_per_connection: int = TTS_POOL_MAX_CONTEXTS_PER_CONNECTION,
+        keepalive_interval: float = TTS_POOL_KEEPALIVE_INTERVAL
+    ):
+        self.max_connections = max_connections
+        self.max_contexts_per_connection = max_contexts_per_connection
+        self.keepalive_interval = keepalive_interval
+        self.metrics = TTSPoolMetrics()
+        self._connections: Dict[Tuple[str, str], List[TTSConnection]] = {}
+        # Guards the connection lists only; handshakes happen outside it
+        self._lock = asyncio.Lock()
+        # Handshakes in progress per key, counted against max_connections
+        self._connecting: Dict[Tuple[str, str], int] = {}
+        # Notified when a handshake finishes or a context is released, for
+        # acquirers waiting on a full pool
+        self._changed = asyncio.Condition(self._lock)
+        # Closes and aborts still running in the background
+        self._background: Set[asyncio.Task] = set()
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def _in_background(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _close_in_background(self, connection: TTSConnection):
+        self._in_background(connection.close())
+
+    async def _abort(self, context: TTSContext):
+        try:
+            await asyncio.wait_for(context.abort(), timeout=1)
+        except Exception:
+            pass
+
+    def _drop_dead(self, connections: List[TTSConnection]):
+        # Sockets that died since last use
+        for connection in [c for c in connections if not c.is_open]:
+            connections.remove(connection)
+            self._close_in_background(connection)
+            self.metrics.reconnects += 1
+
+    async def _connect(self, key: Tuple[str, str]) -> TTSConnection:
+        """Open a connection for key outside the lock; the caller reserved a slot in _connecting."""
+        connection = TTSConnection(key[0], key[1], self.metrics)
+        try:
+            await connection.connect()
+        finally:
+            async with self._lock:
+                self._connecting[key] -= 1
+                self._changed.notify_all()
+        return connection
+
+    async def acquire(self, voice_id: str, model: str) -> TTSContext:
+        key = (voice_id, model)
+        waited = False
+
+        async with self._lock:
+            self._ensure_keepalive()
+
+            while True:
+                connections = self._connections.setdefault(key, [])
+                self._drop_dead(connections)
+
+                candidates = [
+                    c for c in connections
+                    if len(c.contexts) < self.max_contexts_per_connection
+                ]
+
+                if candidates:
+                    self.metrics.reuses += 1
+                    return min(candidates, key=lambda c: len(c.contexts)).open_context()
+
+                if len(connections) + self._connecting.get(key, 0) < self.max_connections:
+                    self._connecting[key] = self._connecting.get(key, 0) + 1
+                    break
+
+                # Every context slot is taken or still connecting; wait for one to free up
+                if not waited:
+                    self.metrics.waits += 1
+                    waited = True
+                await self._changed.wait()
+
+        connection = await self._connect(key)
+
+        async with self._lock:
+            self._connections.setdefault(key, []).append(connection)
+            self._changed.notify_all()
+            return connection.open_context()
+
+    async def _notify_released(self):
+        async with self._lock:
+            self._changed.notify_all()
+
+    def release(self, context: TTSContext, healthy: bool = True):
+        connection = context.connection
+        connection.release_context(context)
+        if not healthy:
+            if not connection.is_open or not connection.contexts:
+                self._close_in_background(connection)
+            else:
+                # Other sessions are mid-reply on this socket; stop only the failed context
+                self._in_background(self._abort(context))
+        # The freed slot (or dead socket) may let a waiting acquire() through
+        self._in_background(self._notify_released())
+
+    async def warm_up(self, voice_id: str, model: str):
+        """Open one connection ahead of the first reply."""
+        key = (voice_id, model)
+
+        async with self._lock:
+            self._ensure_keepalive()
+            connections = self._connections.setdefault(key, [])
+            if any(c.is_open for c in connections) or self._connecting.get(key, 0):
+                return
+            self._connecting[key] = 1
+
+        connection = await self._connect(key)
+
+        async with self._lock:
+            self._connections.setdefault(key, []).append(connection)
+            self._changed.notify_all()
+
+    def _ensure_keepalive(self):
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            for key, connections in list(self._connections.items()):
+                for connection in list(connections):
+                    if connection.contexts:
+                        continue
+                    if connection.is_open and await connection.ping():
+                        continue
+
+                    async with self._lock:
+                        # acquire() may have handed it out while we were pinging
+                        if connection.contexts or connection not in connections:
+                            continue
+                        connections.remove(connection)
+                        self._connecting[key] = self._connecting.get(key, 0) + 1
+
+                    print(f"[WARN] TTS pool connection unhealthy, reconnecting ({key})")
+                    self._close_in_background(connection)
+                    try:
+                        replacement = await self._connect(key)
+                    except Exception as e:
+                        print(f"[ERROR] TTS pool reconnect failed: {e}")
+                        continue
+
+                    async with self._lock:
+                        connections.append(replacement)
+                        self.metrics.reconnects += 1
+                        self._changed.notify_all()
+
+    async def close(self):
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+        for connections in self._connections.values():
+            for connection in connections:
+                await connection.close()
+        self._connections = {}
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        metrics = self.metrics.as_dict()
+        metrics["open_connections"] = sum(
+            1 for connections in self._connections.values()
+            for c in connections if c.is_open
+        )
+        return metrics
+
+
+_tts_pool: Optional[TTSConnectionPool] = None
+
+
+def get_tts_pool() -> TTSConnectionPool:
+    global _tts_pool
+
+    if _tts_pool is None:
+        _tts_pool = TTSConnectionPool()
+
+    return _tts_pool
+
+
+async def close_tts_pool():
+    global _tts_pool
+
+    if _tts_pool is not None:
+        await _tts_pool.close()
+        _tts_pool = None
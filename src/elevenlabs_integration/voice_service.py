@@ -1,12 +1,14 @@
 import os
 import asyncio
-import websockets
-import json
-import base64
 from typing import Optional, Dict, Any, AsyncIterator, Callable
-import requests
+import httpx
 from dotenv import load_dotenv
 
+from .tts_pool import get_tts_pool, TTSContext
+from .tts_cache import get_tts_cache, TTS_CACHE_ENABLED
+from .chunking import text_chunker, split_first_sentence
+from .http_client import get_http_client, run_sync
+
 load_dotenv()
 
 # ElevenLabs Configuration
@@ -19,7 +21,7 @@ ELEVENLABS_STT_MODEL = os.getenv("ELEVENLABS_STT_MODEL", "scribe_v1")
 ELEVENLABS_API_URL = "https://api.elevenlabs.io/v1"
 
 
-def text_to_speech(
+async def text_to_speech_async(
     text: str,
     voice_id: Optional[str] = None,
     model: Optional[str] = None,
@@ -48,21 +50,32 @@ def text_to_speech(
     }
     
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = await get_http_client().post(url, json=data, headers=headers)
         response.raise_for_status()
         return response.content
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"[ERROR] ElevenLabs TTS error: {e}")
         raise
 
 
-def speech_to_text_from_bytes(
+def text_to_speech(
+    text: str,
+    voice_id: Optional[str] = None,
+    model: Optional[str] = None,
+    stability: float = 0.5,
+    similarity_boost: float = 0.75
+) -> bytes:
+
+    return run_sync(text_to_speech_async(text, voice_id, model, stability, similarity_boost))
+
+
+async def speech_to_text_from_bytes_async(
     audio_data,
     filename: str = "audio.mp3",
     model: Optional[str] = None,
     language_code: Optional[str] = None,
 ) -> Dict[str, Any]:
-    """Original STT - kept for compatibility"""
+
     model = model or ELEVENLABS_STT_MODEL
     url = f"{ELEVENLABS_API_URL}/speech-to-text"
     
@@ -82,7 +95,7 @@ def speech_to_text_from_bytes(
         data["language_code"] = language_code
     
     try:
-        response = requests.post(url, headers=headers, files=files, data=data)
+        response = await get_http_client().post(url, headers=headers, files=files, data=data)
         response.raise_for_status()
         result = response.json()
         
@@ -94,10 +107,10 @@ def speech_to_text_from_bytes(
             "full_response": result
         }
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"[ERROR] ElevenLabs STT error: {e}")
         
-        if hasattr(e, 'response') and e.response is not None:
+        if isinstance(e, httpx.HTTPStatusError):
             print(f"[ERROR] Response: {e.response.text}")
         return {
             "status": "error",
@@ -106,27 +119,200 @@ def speech_to_text_from_bytes(
         }
 
 
-async def text_chunker(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+def speech_to_text_from_bytes(
+    audio_data,
+    filename: str = "audio.mp3",
+    model: Optional[str] = None,
+    language_code: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Original STT - kept for compatibility"""
+    return run_sync(speech_to_text_from_bytes_async(audio_data, filename, model, language_code))
+
+
+async def _deliver(audio_callback: Callable[[bytes], None], audio_chunk: bytes):
+    if asyncio.iscoroutinefunction(audio_callback):
+        await audio_callback(audio_chunk)
+    else:
+        audio_callback(audio_chunk)
+
+
+class LiveSegment:
+    """A run of uncached text synthesized on one context, audio buffered until its turn to play."""
 
-    splitters = (".", ",", "?", "!", ";", ":", "—", "-", "(", ")", "[", "]", "}", " ")
-    buffer = ""
+    def __init__(self, context: TTSContext):
+        self.context = context
+        self.text_parts = []
+        self.audio_chunks = []
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.finished = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts)
+
+    def _on_audio(self, audio_chunk: bytes):
+        self.audio_chunks.append(audio_chunk)
+        self.queue.put_nowait(audio_chunk)
+
+    async def receive(self):
+        try:
+            await self.context.receive_audio(self._on_audio)
+        finally:
+            self.queue.put_nowait(None)
+
+    async def send(self, text: str, flush: bool = False):
+        self.text_parts.append(text)
+        await self.context.send_text(text, flush=flush)
+
+    async def finish(self):
+        self.finished = True
+        await self.context.end_input()
+
+
+async def _stream_tts_spliced(
+    text_iterator: AsyncIterator[str],
+    audio_callback: Callable[[bytes], None],
+    voice_id: str,
+    model: str,
+    voice_settings: Dict[str, float]
+):
+    """
+    Cached sentences are played from the phrase cache; everything between
+    them is streamed, still merged by the chunker, into one live context,
+    and the audio goes out in text order. A reply with no cached sentence
+    in the middle uses a single context. Text that could still become a
+    cached sentence is held back; anything else is sent as it arrives.
+    """
+    cache = get_tts_cache()
+    pool = get_tts_pool()
+    segments: asyncio.Queue = asyncio.Queue()
+    live_segments = []
+    
+    async def emit():
+        while True:
+            segment = await segments.get()
+            if segment is None:
+                return
+            if isinstance(segment, bytes):
+                await _deliver(audio_callback, segment)
+                continue
+            while True:
+                audio_chunk = await segment.queue.get()
+                if audio_chunk is None:
+                    break
+                await _deliver(audio_callback, audio_chunk)
+    
+    async def receive(segment: LiveSegment):
+        try:
+            await segment.receive()
+        finally:
+            # Hand the context back at isFinal, not at the end of the turn
+            pool.release(segment.context, healthy=segment.context.connection.is_open)
+    
+    async def open_live() -> LiveSegment:
+        context = await pool.acquire(voice_id, model)
+        try:
+            await context.start(voice_settings)
+        except BaseException:
+            pool.release(context, healthy=context.connection.is_open)
+            raise
+        segment = LiveSegment(context)
+        segment.task = asyncio.create_task(receive(segment))
+        live_segments.append(segment)
+        await segments.put(segment)
+        return segment
     
-    async for text in chunks:
+    emitter = asyncio.create_task(emit())
+    current: Optional[LiveSegment] = None
+    pending = ""
+    # The start of the sentence at the head of pending was already sent live
+    in_sentence = False
+    first_send = True
+    
+    async def send_live(text: str):
+        nonlocal current, first_send
         if not text:
-            continue
+            return
+        if current is None:
+            current = await open_live()
+        # The opening clause is short; have it synthesized now rather than buffered
+        await current.send(text, flush=first_send)
+        first_send = False
+    
+    async def end_live():
+        nonlocal current
+        if current is not None:
+            await current.finish()
+            current = None
+    
+    async def play_cached(sentence: str, live_text: str = "") -> bool:
+        audio = await cache.get_async(sentence, voice_id, model, voice_settings)
+        if audio is None:
+            return False
+        # The live run so far plays first; text after the phrase starts a new one
+        await send_live(live_text)
+        await end_live()
+        await segments.put(audio)
+        return True
+    
+    try:
+        async for text_chunk in text_chunker(text_iterator):
+            pending += text_chunk
+            live_text = ""
+            
+            while pending:
+                sentence, rest = split_first_sentence(pending)
+                
+                if rest is not None:
+                    pending = rest
+                    if not in_sentence and await play_cached(sentence, live_text):
+                        live_text = ""
+                        continue
+                    live_text += sentence + " "
+                    in_sentence = False
+                    continue
+                
+                if not in_sentence and cache.has_prefix(pending, voice_id, model, voice_settings):
+                    # Might turn out to be a cached phrase, wait for the rest
+                    break
+                
+                live_text += pending
+                in_sentence = True
+                pending = ""
             
-        if buffer.endswith(splitters):
-            yield buffer + " "
-            buffer = text
-        elif text.startswith(splitters):
-            output = buffer + text[0] + " "
-            yield output
-            buffer = text[1:]
-        else:
-            buffer += text
+            # One message per chunk keeps the chunker's merging
+            await send_live(live_text)
+        
+        if pending.strip() and not await play_cached(pending.strip()):
+            await send_live(pending)
+        await end_live()
+        
+        await segments.put(None)
+        await emitter
+        await asyncio.gather(*(segment.task for segment in live_segments))
+        
+    except BaseException as e:
+        # Barge-in or a failed segment: stop every context still synthesising
+        emitter.cancel()
+        for segment in live_segments:
+            if not segment.task.done():
+                segment.task.cancel()
+                try:
+                    await asyncio.wait_for(segment.context.abort(), timeout=1)
+                except Exception:
+                    pass
+        if not isinstance(e, asyncio.CancelledError):
+            print(f"[ERROR] WebSocket streaming error: {e}")
+        raise
     
-    if buffer:
-        yield buffer + " "
+    # Recurring sentences are stored once their audio is complete; only a
+    # run holding exactly one sentence maps cleanly to its audio
+    for segment in live_segments:
+        text = segment.text
+        if split_first_sentence(text.strip())[1] is None and segment.audio_chunks:
+            if cache.should_store(text, voice_id, model, voice_settings):
+                await asyncio.to_thread(cache.put, text, voice_id, model, voice_settings, b"".join(segment.audio_chunks))
 
 
 async def stream_tts_websocket(
@@ -139,67 +325,68 @@ async def stream_tts_websocket(
 ):
 
     voice_id = voice_id or ELEVENLABS_VOICE_ID
-    uri = f"wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream-input?model_id={model}"
     
-    print(f"[INFO] Connecting to ElevenLabs WebSocket...")
+    if TTS_CACHE_ENABLED:
+        await _stream_tts_spliced(
+            text_iterator,
+            audio_callback,
+            voice_id,
+            model,
+            {"stability": stability, "similarity_boost": similarity_boost}
+        )
+        return
+    
+    pool = get_tts_pool()
+    
+    context = await pool.acquire(voice_id, model)
+    healthy = True
     
     try:
-        async with websockets.connect(uri) as websocket:
-            # Send initial configuration
-            initial_message = {
-                "text": " ",
-                "voice_settings": {
-                    "stability": stability,
-                    "similarity_boost": similarity_boost
-                },
-                "xi_api_key": ELEVENLABS_API_KEY,
-            }
-            
-            await websocket.send(json.dumps(initial_message))
-            print("[INFO] WebSocket connected and initialized")
-            
-            async def receive_audio():
-                try:
-                    while True:
-                        message = await websocket.recv()
-                        data = json.loads(message)
-                        
-                        if data.get("audio"):
-                            audio_chunk = base64.b64decode(data["audio"])
-                            if asyncio.iscoroutinefunction(audio_callback):
-                                await audio_callback(audio_chunk)
-                            else:
-                                audio_callback(audio_chunk)
-                            print(f"[DEBUG] Received audio chunk: {len(audio_chunk)} bytes")
-                        
-                        if data.get("isFinal"):
-                            print("[INFO] Final audio chunk received")
-                            break
-                            
-                except websockets.exceptions.ConnectionClosed:
-                    print("[INFO] Audio reception completed")
-            
-            receive_task = asyncio.create_task(receive_audio())
-            
+        await context.start({
+            "stability": stability,
+            "similarity_boost": similarity_boost
+        })
+        print(f"[INFO] TTS context {context.context_id[:8]} started on pooled connection")
+        
+        receive_task = asyncio.create_task(context.receive_audio(audio_callback))
+        
+        try:
             chunk_count = 0
             async for text_chunk in text_chunker(text_iterator):
                 chunk_count += 1
-                message = {
-                    "text": text_chunk,
-                    "try_trigger_generation": True
-                }
-                await websocket.send(json.dumps(message))
+                # The opening clause is short; have it synthesized now rather than buffered
+                await context.send_text(text_chunk, flush=chunk_count == 1)
                 print(f"[DEBUG] Sent text chunk {chunk_count}: {text_chunk[:50]}...")
             
-            await websocket.send(json.dumps({"text": ""}))
+            await context.end_input()
             print("[INFO] End-of-stream signal sent")
-            
-            await receive_task
-            print("[INFO] Streaming completed successfully")
-            
+        except BaseException:
+            receive_task.cancel()
+            raise
+        
+        await receive_task
+        print("[INFO] Streaming completed successfully")
+        
+    except asyncio.CancelledError:
+        # Barge-in: stop ElevenLabs synthesising audio nobody will hear
+        try:
+            await asyncio.wait_for(context.abort(), timeout=1)
+        except Exception:
+            healthy = False
+        raise
     except Exception as e:
+        healthy = not isinstance(e, ConnectionError) and context.connection.is_open
         print(f"[ERROR] WebSocket streaming error: {e}")
         raise
+    finally:
+        pool.release(context, healthy=healthy)
+
+
+def get_tts_metrics() -> Dict[str, Any]:
+    metrics = get_tts_pool().get_metrics()
+    if TTS_CACHE_ENABLED:
+        metrics["phrase_cache"] = get_tts_cache().get_stats()
+    return metrics
 
 
 
@@ -1,7 +1,10 @@
-from .agent import AppointmentAgent, test_agent
+from .agent import AppointmentAgent, test_agent, get_openai_client, close_openai_client
+from .history import HistoryManager, TokenCounter
+from .router import IntentRouter, parse_spoken_email, extract_dates
 from .prompts import (
     get_system_prompt,
     get_custom_prompt,
+    get_session_context_message,
     APPOINTMENT_AGENT_SYSTEM_PROMPT
 )
 
@@ -9,7 +12,15 @@ __all__ = [
     
     "AppointmentAgent",
     "test_agent",
+    "get_openai_client",
+    "close_openai_client",
+    "HistoryManager",
+    "TokenCounter",
+    "IntentRouter",
+    "parse_spoken_email",
+    "extract_dates",
     "get_system_prompt",
     "get_custom_prompt",
+    "get_session_context_message",
     "APPOINTMENT_AGENT_SYSTEM_PROMPT",
 ]
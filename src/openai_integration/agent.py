@@ -5,21 +5,82 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import json
 import os
-from typing import Dict, List, Optional
-from openai import OpenAI
+import asyncio
+import uuid
+from typing import Dict, List, Optional, AsyncIterator, Callable, Awaitable
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
-from tools import TOOLS_SCHEMA, execute_function_call
-from .prompts import get_system_prompt
+from tools import TOOLS_SCHEMA, execute_function_call, prefetch_availability, get_likely_date_sets
+from .prompts import get_system_prompt, get_session_context_message
+from .history import HistoryManager, strip_internal_keys
+from .router import IntentRouter, extract_dates
 
 load_dotenv()
 
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_DAYS = int(os.getenv("PREFETCH_DAYS", 5))
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", 20))
+
+# Tools that change booking state run one after another, in the order issued
+STATEFUL_TOOLS = {"reserve_slot_temporarily", "book_appointment", "cancel_booking"}
+
+_shared_client: Optional[AsyncOpenAI] = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Process-wide async client so every session shares one connection pool"""
+    global _shared_client
+    
+    if _shared_client is None:
+        _shared_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=OPENAI_TIMEOUT
+            )
+        )
+    
+    return _shared_client
+
+
+async def close_openai_client():
+    global _shared_client
+    
+    if _shared_client is not None:
+        await _shared_client.close()
+        _shared_client = None
+
+
 class AppointmentAgent:
         
-    def __init__(self, model: str = "gpt-4o", custom_prompt: Optional[str] = None):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        model: str = "gpt-4o",
+        custom_prompt: Optional[str] = None,
+        client: Optional[AsyncOpenAI] = None
+    ):
+        self.client = client or get_openai_client()
         
         self.model = model
+        self.history_manager = HistoryManager(model)
+        self.usage_log = []
+        self.router = IntentRouter()
+        self.fast_path_turns = 0
+        self.skipped_completions = 0
+        self.mentioned_dates = []
+        # Calls that changed booking state; a turn that made one cannot be rolled back
+        self.stateful_calls = 0
+        self._prefetch_task: Optional[asyncio.Task] = None
         self.conversation_history = []
         self.user_context = {
             "name": None,
@@ -38,66 +99,375 @@ class AppointmentAgent:
     async def process_message(self, user_message: str) -> str:
         """Process message - now async to handle async tool calls"""
         
+        parts = []
+        async for delta in self.stream_message(user_message):
+            parts.append(delta)
+        
+        return "".join(parts)
+    
+    async def stream_message(
+        self,
+        user_message: str,
+        on_tool_calls: Optional[Callable[[List[Dict], str], Awaitable[None]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the assistant's reply as token deltas, across tool calls.
+        on_tool_calls(tool_calls, content_so_far) is awaited right before the
+        model's tool calls run, e.g. to fill the silence.
+        """
+        
+        generated = []
+        turn = self._stream_turn(user_message, on_tool_calls)
+        try:
+            async for delta in turn:
+                generated.append(delta)
+                yield delta
+        except (asyncio.CancelledError, GeneratorExit):
+            # Barge-in: keep the history valid and record what was said so far
+            await turn.aclose()
+            self._close_interrupted_turn("".join(generated))
+            raise
+    
+    def _close_interrupted_turn(self, generated: str):
+        last = self.conversation_history[-1]
+        if last["role"] == "assistant" and last.get("tool_calls"):
+            # Tool calls without results would be rejected by the API
+            self.conversation_history.pop()
+            last = self.conversation_history[-1]
+        
+        if last["role"] == "assistant":
+            return
+        
+        if generated.strip():
+            self.conversation_history.append({
+                "role": "assistant",
+                "content": generated.strip() + " ..."
+            })
+    
+    async def _stream_turn(self, user_message: str, on_tool_calls=None) -> AsyncIterator[str]:
         self.conversation_history.append({
             "role": "user",
             "content": user_message
         })
         
-        response = self.client.chat.completions.create(
+        # Keep the prompt within the token budget as the call grows
+        self.conversation_history = self.history_manager.compact(
+            self.conversation_history,
+            self.user_context
+        )
+        
+        if PREFETCH_ENABLED:
+            self._schedule_prefetch(user_message)
+        
+        routed = None
+        if FAST_PATH_ENABLED:
+            routed = self.router.route(
+                user_message,
+                self.user_context,
+                self._last_assistant_message()
+            )
+        
+        if routed:
+            async for delta in self._stream_fast_path(routed):
+                yield delta
+            return
+        
+        stream = await self.client.chat.completions.create(
             model=self.model,
-            messages=self.conversation_history,
+            messages=self._build_request_messages(),
             tools=TOOLS_SCHEMA,
-            tool_choice="auto"
+            tool_choice="auto",
+            stream=True,
+            stream_options={"include_usage": True}
         )
         
-        response_message = response.choices[0].message
-        tool_calls = response_message.tool_calls
+        content_parts = []
+        tool_calls = {}
+        
+        async for chunk in stream:
+            if chunk.usage:
+                self._record_usage(chunk.usage, "first")
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            
+            if delta.content:
+                content_parts.append(delta.content)
+                yield delta.content
+            
+            # Tool calls arrive in fragments keyed by index
+            for tool_call_delta in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(tool_call_delta.index, {
+                    "id": None,
+                    "name": "",
+                    "arguments": ""
+                })
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    tool_call["name"] += tool_call_delta.function.name or ""
+                    tool_call["arguments"] += tool_call_delta.function.arguments or ""
+        
+        content = "".join(content_parts)
         
         if not tool_calls:
-            assistant_message = response_message.content
             self.conversation_history.append({
                 "role": "assistant",
-                "content": assistant_message
+                "content": content
             })
-            return assistant_message
+            return
         
-        self.conversation_history.append(response_message)
+        tool_calls = [tool_calls[index] for index in sorted(tool_calls)]
         
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_args = json.loads(tool_call.function.arguments)
-            
-            print(f"[DEBUG] Calling function: {function_name}")
-            print(f"[DEBUG] Arguments: {json.dumps(function_args, indent=2)}")
-            
-            function_response = await execute_function_call(function_name, function_args)
-            
-            print(f"[DEBUG] Function response: {json.dumps(function_response, indent=2)}")
-            
-            if function_name == "collect_user_info":
-                for key, value in function_args.items():
-                    if value:
-                        self.user_context[key] = value
-            
+        if on_tool_calls is not None:
+            await on_tool_calls(tool_calls, content)
+        
+        self._append_tool_call_message(tool_calls, content)
+        results = await self._execute_tool_calls(tool_calls)
+        
+        speech = self._speakable_answer(results)
+        if speech is not None:
+            self.skipped_completions += 1
+            print("[INFO] Tool results are directly speakable, skipping second completion")
+            if content:
+                speech = " " + speech
             self.conversation_history.append({
-                "role": "tool",
-                "tool_call_id": tool_call.id,
-                "name": function_name,
-                "content": json.dumps(function_response)
+                "role": "assistant",
+                "content": speech.strip()
             })
+            yield speech
+            return
+        
+        async for delta in self._stream_final_answer():
+            yield delta
+    
+    @staticmethod
+    def _speakable_answer(results: List[Dict]) -> Optional[str]:
+        """
+        Tools can put a voice-ready answer under "speak". When every result
+        has one there is nothing left for the model to reason about.
+        """
+        if not results or not all(result.get("speak") for result in results):
+            return None
+        return " ".join(result["speak"] for result in results)
+    
+    async def _stream_fast_path(self, routed: Dict) -> AsyncIterator[str]:
+        """Run a turn the router handled, falling back to the model if needed"""
+        tool_calls = [
+            {
+                "id": f"fastpath_{uuid.uuid4().hex[:12]}",
+                "name": tool_call["name"],
+                "arguments": json.dumps(tool_call["arguments"])
+            }
+            for tool_call in routed["tool_calls"]
+        ]
+        
+        results = []
+        if tool_calls:
+            self._append_tool_call_message(tool_calls)
+            results = await self._execute_tool_calls(tool_calls)
+        
+        reply = routed["reply"](results)
+        
+        if reply is None:
+            # The tool result needs reasoning, let the model phrase it
+            async for delta in self._stream_final_answer():
+                yield delta
+            return
+        
+        self.fast_path_turns += 1
+        print(f"[FASTPATH] Handled '{routed['intent']}' without the LLM")
+        
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": reply
+        })
+        yield reply
+    
+    def _append_tool_call_message(self, tool_calls: List[Dict], content: Optional[str] = None):
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": content or None,
+            "tool_calls": [
+                {
+                    "id": tool_call["id"],
+                    "type": "function",
+                    "function": {
+                        "name": tool_call["name"],
+                        "arguments": tool_call["arguments"]
+                    }
+                }
+                for tool_call in tool_calls
+            ]
+        })
+    
+    async def _stream_final_answer(self) -> AsyncIterator[str]:
+        """Second completion that turns the tool results into speech"""
         
-        second_response = self.client.chat.completions.create(
+        # Same tools as the first request so both share the cached prefix
+        second_stream = await self.client.chat.completions.create(
             model=self.model,
-            messages=self.conversation_history
+            messages=self._build_request_messages(),
+            tools=TOOLS_SCHEMA,
+            tool_choice="none",
+            stream=True,
+            stream_options={"include_usage": True}
         )
         
-        final_message = second_response.choices[0].message.content
+        final_parts = []
+        async for chunk in second_stream:
+            if chunk.usage:
+                self._record_usage(chunk.usage, "second")
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                final_parts.append(delta.content)
+                yield delta.content
+        
         self.conversation_history.append({
             "role": "assistant",
-            "content": final_message
+            "content": "".join(final_parts)
         })
+    
+    def _schedule_prefetch(self, user_message: str):
+        """
+        Warm the availability cache while the caller is still giving their
+        details, so the check_availability call that follows is a cache hit.
+        """
+        new_dates = [d for d in extract_dates(user_message) if d not in self.mentioned_dates]
+        self.mentioned_dates.extend(new_dates)
+        
+        still_collecting = not all(self.user_context.get(key) for key in ("name", "email", "reason"))
+        if not (still_collecting or new_dates):
+            return
+        if self._prefetch_task and not self._prefetch_task.done():
+            return
+        
+        date_sets = get_likely_date_sets(PREFETCH_DAYS, self.mentioned_dates)
+        self._prefetch_task = asyncio.create_task(
+            asyncio.to_thread(prefetch_availability, date_sets)
+        )
+    
+    def _last_assistant_message(self) -> Optional[str]:
+        for message in reversed(self.conversation_history):
+            if message["role"] == "assistant" and message.get("content"):
+                return message["content"]
+        return None
+    
+    def _build_request_messages(self) -> List[Dict]:
+        """Static system prompt first (cacheable), volatile facts last"""
+        return strip_internal_keys(self.conversation_history) + [
+            get_session_context_message(self.user_context)
+        ]
+    
+    def _record_usage(self, usage, phase: str):
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
         
-        return final_message
+        entry = {
+            "phase": phase,
+            "prompt_tokens": usage.prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "uncached_prompt_tokens": usage.prompt_tokens - cached_tokens,
+            "completion_tokens": usage.completion_tokens
+        }
+        self.usage_log.append(entry)
+        
+        print(
+            f"[USAGE] {phase} completion: {entry['prompt_tokens']} prompt tokens "
+            f"({entry['cached_prompt_tokens']} cached, {entry['uncached_prompt_tokens']} uncached)"
+        )
+    
+    def get_usage_log(self) -> List[Dict]:
+        return self.usage_log
+    
+    async def _run_tool_call(self, tool_call: Dict) -> Dict:
+        function_name = tool_call["name"]
+        
+        try:
+            function_args = json.loads(tool_call["arguments"] or "{}")
+        except json.JSONDecodeError as e:
+            return {
+                "status": "error",
+                "message": f"Invalid arguments for {function_name}: {str(e)}"
+            }
+        
+        if function_name in STATEFUL_TOOLS:
+            self.stateful_calls += 1
+        
+        print(f"[DEBUG] Calling function: {function_name}")
+        print(f"[DEBUG] Arguments: {json.dumps(function_args, indent=2)}")
+        
+        # A stateful call cut off after its commit would leave a hold (or a
+        # booking) behind while the model is told it failed, so it runs to the end
+        timeout = None if function_name in STATEFUL_TOOLS else TOOL_CALL_TIMEOUT
+        
+        try:
+            function_response = await asyncio.wait_for(
+                execute_function_call(function_name, function_args),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            function_response = {
+                "status": "error",
+                "message": f"Function '{function_name}' timed out after {TOOL_CALL_TIMEOUT:g} seconds"
+            }
+        
+        print(f"[DEBUG] Function response: {json.dumps(function_response, indent=2)}")
+        
+        if function_name == "collect_user_info":
+            for key, value in function_args.items():
+                if value:
+                    self.user_context[key] = value
+        
+        return function_response
+    
+    async def _run_sequentially(self, tool_calls: List[Dict]) -> List[Dict]:
+        return [await self._run_tool_call(tool_call) for tool_call in tool_calls]
+    
+    async def _execute_tool_calls(self, tool_calls: List[Dict]) -> List[Dict]:
+        """
+        Run independent tool calls concurrently. Calls that change booking
+        state keep their relative order; tool messages are appended in the
+        order the model issued the calls.
+        """
+        independent = [tc for tc in tool_calls if tc["name"] not in STATEFUL_TOOLS]
+        stateful = [tc for tc in tool_calls if tc["name"] in STATEFUL_TOOLS]
+        
+        work = asyncio.ensure_future(asyncio.gather(
+            asyncio.gather(*(self._run_tool_call(tc) for tc in independent)),
+            self._run_sequentially(stateful)
+        ))
+        
+        interrupted = False
+        try:
+            independent_results, stateful_results = await asyncio.shield(work)
+        except asyncio.CancelledError:
+            if not stateful:
+                work.cancel()
+                raise
+            # A booking change may already be committed, its result has to land in history
+            interrupted = True
+            independent_results, stateful_results = await work
+        
+        responses = dict(zip(
+            (tc["id"] for tc in independent + stateful),
+            list(independent_results) + stateful_results
+        ))
+        
+        for tool_call in tool_calls:
+            self.conversation_history.append({
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "name": tool_call["name"],
+                "content": json.dumps(responses[tool_call["id"]])
+            })
+        
+        if interrupted:
+            raise asyncio.CancelledError()
+        
+        return [responses[tool_call["id"]] for tool_call in tool_calls]
     
     def get_user_context(self) -> Dict:
         return self.user_context
@@ -108,6 +478,8 @@ class AppointmentAgent:
     def reset_conversation(self):
         system_message = self.conversation_history[0]
         self.conversation_history = [system_message]
+        self.history_manager = HistoryManager(self.model)
+        self.router = IntentRouter()
         self.user_context = {
             "name": None,
             "email": None,
@@ -115,6 +487,36 @@ class AppointmentAgent:
             "selected_appointment_id": None
         }
     
+    def to_state(self) -> Dict:
+        """JSON-serialisable snapshot of everything a later turn depends on."""
+        return {
+            "model": self.model,
+            "conversation_history": self.conversation_history,
+            "user_context": self.user_context,
+            "mentioned_dates": self.mentioned_dates,
+            "router_awaiting": self.router.awaiting,
+            "dropped_turns": self.history_manager.dropped_turns,
+            "fast_path_turns": self.fast_path_turns,
+            "skipped_completions": self.skipped_completions,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict, client: Optional[AsyncOpenAI] = None) -> "AppointmentAgent":
+        """Rebuild an agent from to_state(), e.g. on another worker."""
+        agent = cls(model=state.get("model", "gpt-4o"), client=client)
+        agent.restore_state(state)
+        return agent
+
+    def restore_state(self, state: Dict):
+        """Roll back to a to_state() snapshot, e.g. after a discarded speculative turn."""
+        self.conversation_history = state["conversation_history"]
+        self.user_context = state["user_context"]
+        self.mentioned_dates = state.get("mentioned_dates", [])
+        self.router.awaiting = state.get("router_awaiting")
+        self.history_manager.dropped_turns = state.get("dropped_turns", 0)
+        self.fast_path_turns = state.get("fast_path_turns", 0)
+        self.skipped_completions = state.get("skipped_completions", 0)
+
     def export_conversation(self, filepath: str):
         with open(filepath, 'w') as f:
             json.dump({
@@ -128,8 +530,6 @@ class AppointmentAgent:
             print("[INFO] System prompt updated")
 
 
-import asyncio
-
 async def test_agent():
     """Test function - now async"""
     agent = AppointmentAgent()
@@ -0,0 +1,183 @@
+"""
+Token-budgeted conversation history.
+
+Keeps the prompt sent to the model roughly constant in size for long calls:
+old tool payloads are compacted into short facts, and once the budget is
+still exceeded the oldest turns are folded into a summary message.
+"""
+
+import os
+import json
+from typing import Dict, List, Any, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 6000))
+HISTORY_MIN_RECENT_TURNS = int(os.getenv("HISTORY_MIN_RECENT_TURNS", 2))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+# Fields of a tool result worth keeping once the turn is over
+TOOL_FACT_KEYS = (
+    "status", "message", "errors", "slot_ids", "total_available",
+    "confirmation_token", "appointment_details", "user_email",
+    "expires_at", "booking_id", "collected_data",
+)
+TOOL_MESSAGE_MAX_CHARS = 200
+
+# Tokens of framing per message in the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """Counts tokens locally, with tiktoken when installed and an estimate otherwise."""
+
+    def __init__(self, model: str = "gpt-4o"):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_text(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        # ~4 characters per token for English text
+        return len(text) // 4 + 1
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(message.get("content"))
+        for tool_call in message.get("tool_calls") or []:
+            tokens += self.count_text(tool_call["function"]["name"])
+            tokens += self.count_text(tool_call["function"]["arguments"])
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+
+def compact_tool_content(content: str) -> str:
+    """Reduce a tool JSON payload to the facts the model still needs."""
+    try:
+        result = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return content[:TOOL_MESSAGE_MAX_CHARS]
+
+    if not isinstance(result, dict):
+        return content[:TOOL_MESSAGE_MAX_CHARS]
+
+    facts = {key: result[key] for key in TOOL_FACT_KEYS if key in result}
+    if isinstance(facts.get("message"), str):
+        facts["message"] = facts["message"][:TOOL_MESSAGE_MAX_CHARS]
+    if "booking" in result and isinstance(result["booking"], dict):
+        facts["booking_id"] = result["booking"].get("booking_id")
+
+    return json.dumps(facts, ensure_ascii=False)
+
+
+class HistoryManager:
+
+    def __init__(
+        self,
+        model: str = "gpt-4o",
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        min_recent_turns: int = HISTORY_MIN_RECENT_TURNS
+    ):
+        self.counter = TokenCounter(model)
+        self.token_budget = token_budget
+        self.min_recent_turns = min_recent_turns
+        self.dropped_turns = 0
+
+    @staticmethod
+    def _split_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """A turn starts at a user message and holds everything up to the next one."""
+        turns = []
+        for message in messages:
+            if message["role"] == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def _summary_message(self, user_context: Dict[str, Any], facts: List[str]) -> Dict[str, str]:
+        known = {key: value for key, value in user_context.items() if value}
+        lines = [SUMMARY_PREFIX]
+        if known:
+            lines.append("Known caller details: " + json.dumps(known, ensure_ascii=False))
+        lines.extend(facts[-10:])
+        lines.append(f"({self.dropped_turns} earlier turns omitted.)")
+        return {"role": "system", "content": "\n".join(lines)}
+
+    def compact(self, history: List[Dict[str, Any]], user_context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Return a history that fits the token budget. history[0] must be the system prompt."""
+        system_message = history[0]
+        rest = history[1:]
+
+        previous_summary = None
+        if rest and rest[0]["role"] == "system" and rest[0]["content"].startswith(SUMMARY_PREFIX):
+            previous_summary = rest[0]
+            rest = rest[1:]
+
+        turns = self._split_turns(rest)
+
+        # 1. Compact tool payloads of every turn except the current one
+        for turn in turns[:-1]:
+            for index, message in enumerate(turn):
+                if message["role"] == "tool" and not message.get("compacted"):
+                    turn[index] = dict(
+                        message,
+                        content=compact_tool_content(message["content"]),
+                        compacted=True
+                    )
+
+        def total(summary):
+            messages = [system_message] + ([summary] if summary else [])
+            messages += [m for turn in turns for m in turn]
+            return self.counter.count_messages(messages)
+
+        summary = previous_summary
+        if total(summary) <= self.token_budget:
+            return self._flatten(system_message, summary, turns)
+
+        # 2. Fold the oldest turns into the summary until the budget fits
+        facts = []
+        if previous_summary:
+            facts = [
+                line for line in previous_summary["content"].splitlines()[1:]
+                if not line.startswith("Known caller details") and not line.endswith("turns omitted.)")
+            ]
+
+        while len(turns) > self.min_recent_turns and total(summary) > self.token_budget:
+            dropped = turns.pop(0)
+            self.dropped_turns += 1
+            for message in dropped:
+                if message["role"] == "tool":
+                    facts.append(f"- {message.get('name', 'tool')}: {compact_tool_content(message['content'])}")
+            summary = self._summary_message(user_context, facts)
+
+        return self._flatten(system_message, summary, turns)
+
+    @staticmethod
+    def _flatten(system_message, summary, turns) -> List[Dict[str, Any]]:
+        messages = [system_message]
+        if summary:
+            messages.append(summary)
+        for turn in turns:
+            messages.extend(turn)
+        return messages
+
+    def token_count(self, history: List[Dict[str, Any]]) -> int:
+        return self.counter.count_messages(history)
+
+
+def strip_internal_keys(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Remove bookkeeping keys the chat API does not accept."""
+    return [
+        {key: value for key, value in message.items() if key != "compacted"}
+        for message in messages
+    ]
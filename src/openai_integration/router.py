@@ -0,0 +1,209 @@
+"""
+Deterministic fast path for simple turns.
+
+Recognises a handful of utterances that do not need the model: "repeat
+that", spelled-out email addresses and their yes/no confirmation, and plain
+date answers once name, email and reason are known. Anything it is not sure
+about returns None and goes to the LLM as before.
+"""
+
+import re
+from typing import Dict, List, Any, Optional, Callable
+
+from tools import validate_email
+from tools.availability import parse_date_from_text
+from tools.slot_store import get_slot_store
+
+YES_PHRASES = {
+    "yes", "yeah", "yep", "yup", "correct", "right", "exactly", "sure",
+    "thats right", "that is right", "thats correct", "that is correct",
+    "yes thats right", "yes thats correct", "yes correct", "yes please",
+}
+
+NO_PHRASES = {
+    "no", "nope", "nah", "incorrect", "wrong", "not quite",
+    "thats wrong", "that is wrong", "thats not right", "no thats wrong",
+}
+
+REPEAT_PATTERN = re.compile(
+    r"^(can you |could you |please |sorry )*"
+    r"(repeat( that| it)?( please)?|say (that|it) again( please)?|pardon( me)?|come again|what did you say)$"
+)
+
+EMAIL_PREFIX_PATTERN = re.compile(r"^(my email( address)? is|its|it is|email is|sure its|sure it is)\s+")
+
+SPOKEN_EMAIL_TOKENS = [
+    (r"\s+at\s+", "@"),
+    (r"\s+dot\s+", "."),
+    (r"\s*underscore\s*", "_"),
+    (r"\s*(dash|hyphen)\s*", "-"),
+]
+
+# Letters spelled one at a time, possibly joined by ". _ -": "k", "h.m"
+SPELLED_TOKEN_PATTERN = re.compile(r"^\w([._-]\w)*$")
+
+MONTHS = (
+    "january", "february", "march", "april", "may", "june", "july",
+    "august", "september", "october", "november", "december",
+)
+
+DAY_PATTERN = re.compile(r"^(?P<day>\d{1,2})(?P<ordinal>st|nd|rd|th)?$")
+
+# Words that may sit between a month and its days: "December the 5th or 6th"
+DATE_CONNECTORS = {"or", "and", "to", "the", "on"}
+
+TIME_PATTERN = re.compile(r"\d{1,2}(:\d{2})?\s*(am|pm|a\.m\.|p\.m\.|o'?clock)|\d{1,2}:\d{2}|\bnoon\b|\bmorning\b|\bafternoon\b")
+
+
+def normalize_utterance(text: str) -> str:
+    text = text.lower().replace("'", "")
+    text = re.sub(r"[^\w\s@.\-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip(" .")
+
+
+def parse_spoken_email(text: str, whole_utterance: bool = True) -> Optional[str]:
+    """
+    'k r i s h at gmail dot com' -> 'krish@gmail.com'. Only the tokens
+    joined by at/dot and a spelled-out run right before them are used. With
+    whole_utterance the text must be nothing but the address (after an
+    optional "my email is"), otherwise None.
+    """
+    spoken = EMAIL_PREFIX_PATTERN.sub("", normalize_utterance(text))
+
+    for pattern, replacement in SPOKEN_EMAIL_TOKENS:
+        spoken = re.sub(pattern, replacement, spoken)
+
+    tokens = spoken.split(" ")
+    positions = [i for i, token in enumerate(tokens) if "@" in token]
+    if len(positions) != 1:
+        return None
+
+    position = positions[0]
+    start = position
+    if SPELLED_TOKEN_PATTERN.match(tokens[position].split("@")[0]):
+        while start > 0 and SPELLED_TOKEN_PATTERN.match(tokens[start - 1]):
+            start -= 1
+
+    if whole_utterance and (start > 0 or position < len(tokens) - 1):
+        return None
+
+    candidate = "".join(tokens[start:position + 1])
+    if candidate.count("@") != 1 or not validate_email(candidate):
+        return None
+
+    return candidate
+
+
+def extract_dates(text: str) -> List[str]:
+    """
+    Dates named in an answer like 'December 5th or 6th', matched against
+    the dates we actually have slots on. Returns [] when unsure.
+    """
+    normalized = normalize_utterance(text)
+    if TIME_PATTERN.search(normalized):
+        # A specific time means the caller is picking a slot
+        return []
+
+    known_dates = get_slot_store().dates()
+    dates = []
+    month = None
+    previous = None
+
+    for token in normalized.split(" "):
+        token = token.strip(".")
+
+        if token in MONTHS:
+            month = previous = token
+            continue
+
+        match = DAY_PATTERN.match(token)
+        # A bare number only counts next to a month or another day: "for 3 people" is not a date
+        if match and (match.group("ordinal") or previous is not None):
+            if month is None:
+                return []
+
+            parsed = parse_date_from_text(f"{month} {match.group('day')}")
+            if not parsed:
+                return []
+
+            # Match month and day against the slot calendar to pick the year
+            candidates = [d for d in known_dates if d.endswith(parsed[4:])]
+            if not candidates:
+                return []
+            dates.append(candidates[0])
+            previous = "day"
+            continue
+
+        previous = previous if token in DATE_CONNECTORS else None
+
+    return sorted(set(dates))
+
+
+class IntentRouter:
+
+    def __init__(self):
+        # Set when the fast path itself asked a yes/no question
+        self.awaiting: Optional[str] = None
+
+    def route(
+        self,
+        user_message: str,
+        user_context: Dict[str, Any],
+        last_assistant_message: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns {"intent", "tool_calls", "reply"} when confident, where reply
+        is called with the tool results and returns the text to speak.
+        """
+        utterance = normalize_utterance(user_message)
+        awaiting, self.awaiting = self.awaiting, None
+
+        if REPEAT_PATTERN.match(utterance) and last_assistant_message:
+            return self._turn("repeat", [], lambda results: last_assistant_message)
+
+        if awaiting == "email_confirmation":
+            if utterance in YES_PHRASES:
+                return self._turn("confirm_email", [], lambda results: self._next_question(user_context))
+            if utterance in NO_PHRASES:
+                return self._turn(
+                    "reject_email",
+                    [],
+                    lambda results: "Sorry about that. Could you spell your email for me again?"
+                )
+
+        email = parse_spoken_email(user_message)
+        if email:
+            self.awaiting = "email_confirmation"
+            return self._turn(
+                "email",
+                [{"name": "collect_user_info", "arguments": {"email": email}}],
+                lambda results: f"Got it, that's {email}, correct?"
+            )
+
+        if all(user_context.get(key) for key in ("name", "email", "reason")):
+            dates = extract_dates(user_message)
+            if dates:
+                return self._turn(
+                    "dates",
+                    [{"name": "check_availability", "arguments": {"dates": dates}}],
+                    self._availability_reply
+                )
+
+        return None
+
+    @staticmethod
+    def _turn(intent: str, tool_calls: List[Dict[str, Any]], reply: Callable[[List[Dict]], Optional[str]]) -> Dict[str, Any]:
+        return {"intent": intent, "tool_calls": tool_calls, "reply": reply}
+
+    @staticmethod
+    def _next_question(user_context: Dict[str, Any]) -> str:
+        if not user_context.get("name"):
+            return "Perfect. And what's your full name?"
+        if not user_context.get("reason"):
+            return "Perfect. What's the reason for your emergency?"
+        return "Perfect. What dates work for you?"
+
+    @staticmethod
+    def _availability_reply(results: List[Dict[str, Any]]) -> Optional[str]:
+        # No "speak" means there were no slots; suggesting alternatives needs the model
+        return results[0].get("speak")
@@ -0,0 +1,17 @@
+from .store import (
+    SessionStore,
+    InMemorySessionStore,
+    RedisSessionStore,
+    create_session_store,
+    get_session_store,
+    close_session_store,
+)
+
+__all__ = [
+    "SessionStore",
+    "InMemorySessionStore",
+    "RedisSessionStore",
+    "create_session_store",
+    "get_session_store",
+    "close_session_store",
+]
@@ -0,0 +1,89 @@
+"""
+In-process stand-in for the subset of Redis the session store uses, for
+local checks of RedisSessionStore without a server.
+
+    cd src && python -m sessions.fake_redis
+"""
+
+import time
+import asyncio
+from typing import Dict
+
+from .store import RedisSessionStore, ACTIVE_SESSIONS_KEY
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+        self._sorted_sets: Dict[str, Dict[str, float]] = {}
+
+    def _alive(self, key: str) -> bool:
+        entry = self._data.get(key)
+        if entry is None:
+            return False
+        if entry[1] is not None and entry[1] < time.monotonic():
+            del self._data[key]
+            return False
+        return True
+
+    async def get(self, key):
+        return self._data[key][0] if self._alive(key) else None
+
+    async def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        self._data[key] = (value, expires_at)
+        return True
+
+    async def delete(self, *keys):
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    async def zadd(self, key, mapping):
+        members = self._sorted_sets.setdefault(key, {})
+        added = len(set(mapping) - set(members))
+        members.update(mapping)
+        return added
+
+    async def zrem(self, key, *members):
+        sorted_set = self._sorted_sets.get(key, {})
+        return sum(1 for member in members if sorted_set.pop(member, None) is not None)
+
+    async def zremrangebyscore(self, key, low, high):
+        low, high = float(low), float(high)
+        sorted_set = self._sorted_sets.get(key, {})
+        due = [member for member, score in sorted_set.items() if low <= score <= high]
+        for member in due:
+            del sorted_set[member]
+        return len(due)
+
+    async def zcard(self, key):
+        return len(self._sorted_sets.get(key, {}))
+
+    async def aclose(self):
+        pass
+
+
+async def test_session_store():
+    client = FakeRedis()
+    store = RedisSessionStore(client, ttl=1)
+
+    await store.save("a", {"history": [1]})
+    await store.save("b", {"history": [2]})
+    await store.save("a", {"history": [1, 2]})
+    assert await store.load("a") == {"history": [1, 2]}
+    assert await store.count() == 2
+
+    await store.delete("b")
+    assert await store.count() == 1
+
+    # Expired sessions drop out of the count as well as the store
+    await asyncio.sleep(1.1)
+    assert await store.load("a") is None
+    assert await store.count() == 0
+    assert await client.zcard(ACTIVE_SESSIONS_KEY) == 0
+
+    print("[TEST] Session store: save, load, count and expiry OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(test_session_store())
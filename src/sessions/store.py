@@ -0,0 +1,139 @@
+"""
+Session state shared between worker processes.
+
+The in-process store is the default and keeps the single-worker behaviour.
+The Redis store lets any uvicorn worker (or node behind a load balancer)
+pick up a session another one started.
+"""
+
+import os
+import json
+import time
+from typing import Dict, Any, Optional
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 3600))
+
+# Sorted set of session ids scored by expiry time, for count()
+ACTIVE_SESSIONS_KEY = "sessions:active"
+
+
+class SessionStore:
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local, what active_agents used to be."""
+
+    def __init__(self, ttl: int = SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._sessions: Dict[str, tuple] = {}
+
+    async def load(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        expires_at, state = entry
+        if expires_at < time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return json.loads(state)
+
+    async def save(self, session_id, state):
+        # Serialised like the shared store so both behave the same
+        self._sessions[session_id] = (time.monotonic() + self.ttl, json.dumps(state, default=str))
+
+    async def delete(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    async def count(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, (expires_at, _) in self._sessions.items() if expires_at < now]:
+            del self._sessions[session_id]
+        return len(self._sessions)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Any client with the redis.asyncio get/set/delete and zadd/zrem/
+    zremrangebyscore/zcard API. Sessions are kept after a disconnect so the
+    caller can resume; they leave the active set when their TTL runs out.
+    """
+
+    def __init__(self, client, ttl: int = SESSION_TTL_SECONDS, prefix: str = "session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def load(self, session_id):
+        raw = await self.client.get(self.prefix + session_id)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def save(self, session_id, state):
+        await self.client.set(self.prefix + session_id, json.dumps(state, default=str), ex=self.ttl)
+        await self.client.zadd(ACTIVE_SESSIONS_KEY, {session_id: time.time() + self.ttl})
+
+    async def delete(self, session_id):
+        await self.client.delete(self.prefix + session_id)
+        await self.client.zrem(ACTIVE_SESSIONS_KEY, session_id)
+
+    async def count(self):
+        await self.client.zremrangebyscore(ACTIVE_SESSIONS_KEY, "-inf", time.time())
+        return await self.client.zcard(ACTIVE_SESSIONS_KEY)
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close:
+            await close()
+
+
+def create_session_store(name: str = SESSION_STORE) -> SessionStore:
+
+    if name == "memory":
+        return InMemorySessionStore()
+
+    if name == "redis":
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise ImportError("SESSION_STORE=redis requires the 'redis' package")
+        return RedisSessionStore(redis_asyncio.from_url(REDIS_URL, decode_responses=True))
+
+    raise ValueError(f"Unknown session store: {name}")
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+
+    if _session_store is None:
+        _session_store = create_session_store()
+
+    return _session_store
+
+
+async def close_session_store():
+    global _session_store
+
+    if _session_store is not None:
+        await _session_store.close()
+        _session_store = None
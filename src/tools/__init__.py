@@ -1,7 +1,6 @@
-import asyncio
 from typing import Dict, Any
-import json
-from .data_manager import load_data, save_data, get_data_file_path
+from .data_manager import load_data, save_data, get_data_file_path, get_backend, set_backend
+from .storage import StorageBackend, JsonFileBackend, SQLiteBackend, migrate_json_to_sqlite
 
 from .user_info import (
     collect_user_info,
@@ -10,13 +9,18 @@ from .user_info import (
     format_user_data_for_display
 )
 
+from .slot_store import SlotStore, get_slot_store
+
 from .availability import (
     check_availability,
     get_all_available_slots,
     get_next_available_slots,
     is_slot_available,
     get_appointment_by_id,
-    format_slots_for_display
+    format_slots_for_display,
+    prefetch_availability,
+    get_likely_date_sets,
+    get_availability_cache_stats
 )
 
 from .booking import (
@@ -25,15 +29,31 @@ from .booking import (
     get_pending_confirmation,
     get_booking_by_id,
     cancel_booking,
-    cleanup_expired_confirmations
+    cleanup_expired_confirmations,
+    run_expiry_sweeper
 )
 
+from .confirmation_index import ConfirmationIndex, get_confirmation_index
+
 from .email_service import (
     send_confirmation_email,
-    send_booking_confirmation_email
+    send_booking_confirmation_email,
+    get_smtp_pool,
+    close_smtp_pool,
+    render_email,
+    render_emails,
+    build_messages_batch,
+    send_emails_batch
     # ✅ Removed sync wrappers
 )
 
+from .email_outbox import (
+    EmailOutbox,
+    get_email_outbox,
+    enqueue_email,
+    get_email_status
+)
+
 from .schemas import (
     TOOLS_SCHEMA,
     get_tools_schema,
@@ -41,15 +61,25 @@ from .schemas import (
     get_all_function_names
 )
 
-AVAILABLE_FUNCTIONS = {
-    "collect_user_info": collect_user_info,
-    "check_availability": check_availability,
-    "reserve_slot_temporarily": reserve_slot_temporarily,
-    "book_appointment": book_appointment,
-    "cancel_booking": cancel_booking,
-    "send_confirmation_email": send_confirmation_email,
-    "send_booking_confirmation_email": send_booking_confirmation_email,
-}
+from .registry import ToolRegistry, Tool, compile_schema
+
+tool_registry = ToolRegistry()
+tool_registry.register_schemas(
+    {
+        "collect_user_info": collect_user_info,
+        "check_availability": check_availability,
+        "reserve_slot_temporarily": reserve_slot_temporarily,
+        "book_appointment": book_appointment,
+        "cancel_booking": cancel_booking,
+        "send_confirmation_email": send_confirmation_email,
+        "send_booking_confirmation_email": send_booking_confirmation_email,
+    },
+    TOOLS_SCHEMA,
+    # Pure in-memory work, cheaper inline than a thread hop
+    inline=("collect_user_info",)
+)
+
+AVAILABLE_FUNCTIONS = tool_registry.functions()
 
 
 async def get_function_by_name(function_name: str):
@@ -59,35 +89,10 @@ async def get_function_by_name(function_name: str):
 
 async def execute_function_call(function_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Execute function calls - handles both sync and async functions automatically
+    Validate the arguments and run the tool: async tools are awaited,
+    blocking sync tools run in the registry's thread pool
     """
-    function = AVAILABLE_FUNCTIONS.get(function_name)
-    
-    if not function:
-        return {
-            "status": "error",
-            "message": f"Function '{function_name}' not found"
-        }
-    
-    try:
-        # Handle both sync and async functions
-        if asyncio.iscoroutinefunction(function):
-            result = await function(**arguments)
-        else:
-            result = function(**arguments)
-        
-        return result
-        
-    except Exception as e:
-        print(f"[ERROR] Function execution failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        return {
-            "status": "error",
-            "message": f"Error executing function: {str(e)}",
-            "exception_type": type(e).__name__
-        }
+    return await tool_registry.execute(function_name, arguments)
 
 
 __all__ = [
@@ -95,6 +100,14 @@ __all__ = [
     "load_data",
     "save_data",
     "get_data_file_path",
+    "get_backend",
+    "set_backend",
+    
+    # Storage backends
+    "StorageBackend",
+    "JsonFileBackend",
+    "SQLiteBackend",
+    "migrate_json_to_sqlite",
     
     # User info
     "collect_user_info",
@@ -102,6 +115,10 @@ __all__ = [
     "validate_user_data",
     "format_user_data_for_display",
     
+    # Slot store
+    "SlotStore",
+    "get_slot_store",
+    
     # Availability
     "check_availability",
     "get_all_available_slots",
@@ -109,6 +126,9 @@ __all__ = [
     "is_slot_available",
     "get_appointment_by_id",
     "format_slots_for_display",
+    "prefetch_availability",
+    "get_likely_date_sets",
+    "get_availability_cache_stats",
     
     # Booking
     "reserve_slot_temporarily",
@@ -117,10 +137,25 @@ __all__ = [
     "get_booking_by_id",
     "cancel_booking",
     "cleanup_expired_confirmations",
+    "run_expiry_sweeper",
+    "ConfirmationIndex",
+    "get_confirmation_index",
     
     # Email (async only)
     "send_confirmation_email",
     "send_booking_confirmation_email",
+    "get_smtp_pool",
+    "close_smtp_pool",
+    "render_email",
+    "render_emails",
+    "build_messages_batch",
+    "send_emails_batch",
+    
+    # Email outbox
+    "EmailOutbox",
+    "get_email_outbox",
+    "enqueue_email",
+    "get_email_status",
     
     # Schemas
     "TOOLS_SCHEMA",
@@ -129,6 +164,10 @@ __all__ = [
     "get_all_function_names",
     
     # Function execution
+    "ToolRegistry",
+    "Tool",
+    "compile_schema",
+    "tool_registry",
     "AVAILABLE_FUNCTIONS",
     "get_function_by_name",
     "execute_function_call",
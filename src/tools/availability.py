@@ -1,24 +1,107 @@
-from typing import Dict, List, Any
+import os
+import threading
+from typing import Dict, List, Any, Tuple
 from datetime import datetime, timedelta
-from .data_manager import load_data
+from .slot_store import get_slot_store
 from dateutil import parser
 from collections import defaultdict
 
 
+# Availability summaries keyed by the requested dates, tagged with the slot
+# store version they were built from. A change to any of those dates makes
+# the entry stale.
+AVAILABILITY_CACHE_SIZE = int(os.getenv("AVAILABILITY_CACHE_SIZE", 256))
+_availability_cache: Dict[Tuple[str, ...], Tuple[tuple, Dict[str, Any]]] = {}
+_cache_stats = {"hits": 0, "misses": 0, "prefetched": 0}
+# check_availability runs on the tool thread pool; summaries are built outside it
+_cache_lock = threading.Lock()
+
+
 def check_availability(dates: List[str]) -> Dict[str, Any]:
-    data = load_data()
-    available_slots = []
+    key = tuple(sorted(set(dates)))
+    version = get_slot_store().version_of(list(key))
     
-    for appointment in data["appointments"]:
-        if appointment["date"] in dates and appointment["available"]:
-            available_slots.append({
-                "id": appointment["id"],
-                "date": appointment["date"],
-                "time": appointment["time"],
-                "type": appointment["type"]
-            })
+    with _cache_lock:
+        cached = _availability_cache.get(key)
+        if cached and cached[0] == version:
+            _cache_stats["hits"] += 1
+            return dict(cached[1])
+        _cache_stats["misses"] += 1
     
-    available_slots.sort(key=lambda x: (x["date"], x["time"]))
+    result = _build_availability_summary(list(key))
+    _store_summary(key, version, result)
+    
+    return dict(result)
+
+
+def _store_summary(key: Tuple[str, ...], version: tuple, result: Dict[str, Any]) -> None:
+    with _cache_lock:
+        if key not in _availability_cache and len(_availability_cache) >= AVAILABILITY_CACHE_SIZE:
+            # Drop the oldest entry
+            _availability_cache.pop(next(iter(_availability_cache)))
+        _availability_cache[key] = (version, result)
+
+
+def prefetch_availability(date_sets: List[List[str]]) -> int:
+    """Warm the cache for likely queries. Returns how many entries were built."""
+    built = 0
+    
+    for dates in date_sets:
+        key = tuple(sorted(set(dates)))
+        if not key:
+            continue
+        version = get_slot_store().version_of(list(key))
+        with _cache_lock:
+            cached = _availability_cache.get(key)
+        if cached and cached[0] == version:
+            continue
+        _store_summary(key, version, _build_availability_summary(list(key)))
+        built += 1
+    
+    with _cache_lock:
+        _cache_stats["prefetched"] += built
+    return built
+
+
+def get_likely_date_sets(days: int = 5, mentioned_dates: List[str] = None) -> List[List[str]]:
+    """
+    Next open days, each alone and paired with the following one, plus any
+    dates the caller mentioned.
+    """
+    today = datetime.now().date().isoformat()
+    
+    open_days = []
+    for slot in get_slot_store().available_from(today):
+        if slot["date"] not in open_days:
+            open_days.append(slot["date"])
+        if len(open_days) >= days:
+            break
+    
+    date_sets = [[day] for day in open_days]
+    date_sets += [open_days[i:i + 2] for i in range(len(open_days) - 1)]
+    
+    if mentioned_dates:
+        date_sets.append(list(mentioned_dates))
+        date_sets += [[day] for day in mentioned_dates]
+    
+    return date_sets
+
+
+def get_availability_cache_stats() -> Dict[str, int]:
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_availability_cache))
+
+
+def _build_availability_summary(dates: List[str]) -> Dict[str, Any]:
+    available_slots = [
+        {
+            "id": appointment["id"],
+            "date": appointment["date"],
+            "time": appointment["time"],
+            "type": appointment["type"]
+        }
+        for appointment in get_slot_store().available_on_dates(dates)
+    ]
     
     limited_slots = available_slots[:5]
     
@@ -64,37 +147,30 @@ def check_availability(dates: List[str]) -> Dict[str, Any]:
             remaining = len(available_slots) - 5
             message += f" (Plus {remaining} more {'slot' if remaining == 1 else 'slots'} available.)"
     
-    return {
+    result = {
         "status": "success",
         "message": message,
         "slot_ids": [slot["id"] for slot in limited_slots],  # Keep IDs for booking
         "total_available": len(available_slots)
     }
+    
+    # Voice-ready answer the agent can speak without another LLM round-trip.
+    # With no slots the model has to suggest alternatives, so leave it out.
+    if limited_slots:
+        result["speak"] = f"{message} Which one works for you?"
+    
+    return result
 
 
 def get_all_available_slots() -> List[Dict[str, Any]]:
     """Get all available slots"""
-    data = load_data()
-    available_slots = [
-        apt for apt in data["apartments"] 
-        if apt["available"]
-    ]
-    
-    available_slots.sort(key=lambda x: (x["date"], x["time"]))
-    
-    return available_slots
+    return get_slot_store().available_from("")
 
 
 def get_next_available_slots(count: int = 5) -> Dict[str, Any]:
-    data = load_data()
-    today = datetime.now().date()
-    
-    upcoming_slots = [
-        apt for apt in data["appointments"]
-        if apt["available"] and datetime.strptime(apt["date"], "%Y-%m-%d").date() >= today
-    ]
+    today = datetime.now().date().isoformat()
     
-    upcoming_slots.sort(key=lambda x: (x["date"], x["time"]))
+    upcoming_slots = get_slot_store().available_from(today)
     
     limited_slots = upcoming_slots[:count]
     
@@ -137,24 +213,12 @@ def get_next_available_slots(count: int = 5) -> Dict[str, Any]:
 
 
 def is_slot_available(appointment_id: str) -> bool:
-    data = load_data()
-    
-    for appointment in data["appointments"]:
-        if appointment["id"] == appointment_id:
-            return appointment["available"]
-    
-    return False
+    return get_slot_store().is_available(appointment_id)
 
 
 def get_appointment_by_id(appointment_id: str) -> Dict[str, Any]:
     
-    data = load_data()
-    
-    for appointment in data["appointments"]:
-        if appointment["id"] == appointment_id:
-            return appointment
-    
-    return None
+    return get_slot_store().get(appointment_id)
 
 
 def format_slots_for_display(slots: List[Dict[str, Any]]) -> str:
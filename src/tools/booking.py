@@ -1,22 +1,21 @@
+import os
+import asyncio
 import secrets
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from .data_manager import load_data, save_data
+from .data_manager import get_backend
 from .user_info import validate_user_data
-from .availability import get_appointment_by_id
-from .email_service import (
-    send_confirmation_email,
-    send_booking_confirmation_email,
-)
+from .slot_store import get_slot_store
+from .confirmation_index import get_confirmation_index
+from .email_outbox import enqueue_email
 
+EXPIRY_SWEEP_MAX_INTERVAL = float(os.getenv("EXPIRY_SWEEP_MAX_INTERVAL", 60))
 
-async def reserve_slot_temporarily(
-    appointment_id: str, 
-    user_data: Dict[str, str]
-) -> Dict[str, Any]:
-    
-    data = load_data()
+
+def _hold_slot(appointment_id: str, user_data: Dict[str, str]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Blocking part of a reservation: (error result, None) or (None, pending confirmation)."""
+    backend = get_backend()
     
     validation = validate_user_data(user_data)
     if not validation["valid"]:
@@ -24,27 +23,24 @@ async def reserve_slot_temporarily(
             "status": "error",
             "message": "Invalid user data",
             "errors": validation["errors"]
-        }
+        }, None
     
     # Validate that appointment exists and is available
-    appointment = None
-    for apt in data["appointments"]:
-        if apt["id"] == appointment_id:
-            if not apt["available"]:
-                return {
-                    "status": "error",
-                    "message": "This appointment slot is no longer available",
-                    "appointment_id": appointment_id
-                }
-            appointment = apt
-            break
+    appointment = backend.get_appointment(appointment_id)
+    
+    if appointment and not appointment["available"]:
+        return {
+            "status": "error",
+            "message": "This appointment slot is no longer available",
+            "appointment_id": appointment_id
+        }, None
     
     if not appointment:
         return {
             "status": "error",
             "message": "Appointment not found",
             "appointment_id": appointment_id
-        }
+        }, None
     
     token = secrets.token_urlsafe(32)
     created_at = datetime.now()
@@ -68,89 +64,146 @@ async def reserve_slot_temporarily(
         "status": "pending"
     }
     
-    data["pending_confirmations"].append(pending_confirmation)
-    save_data(data)
+    # Atomic hold: exactly one concurrent reserver gets the slot
+    if not backend.reserve_slot(pending_confirmation):
+        return {
+            "status": "error",
+            "message": "This appointment slot is no longer available",
+            "appointment_id": appointment_id
+        }, None
     
-    email_result = await send_confirmation_email(
-        recipient_email=user_data["email"],
-        recipient_name=user_data["name"],
-        appointment_details={
-            "date": appointment["date"],
-            "time": appointment["time"],
-            "type": appointment["type"]
-        },
-        confirmation_token=token,
-        reason=user_data["reason"]
-    )
+    get_slot_store().set_hold(appointment_id, pending_confirmation["expires_at"])
+    get_confirmation_index().add(pending_confirmation)
     
-    print(f"[BOOKING] Email result: {email_result}")
+    return None, pending_confirmation
+
+
+async def reserve_slot_temporarily(
+    appointment_id: str, 
+    user_data: Dict[str, str]
+) -> Dict[str, Any]:
+    
+    # Storage I/O runs off the event loop so other sessions keep streaming
+    error, pending_confirmation = await asyncio.to_thread(_hold_slot, appointment_id, user_data)
+    if error:
+        return error
+    
+    token = pending_confirmation["token"]
+    details = pending_confirmation["appointment_details"]
+    
+    # Delivered by the outbox workers, off the voice critical path
+    email_job_id = await enqueue_email("confirmation", {
+        "recipient_email": user_data["email"],
+        "recipient_name": user_data["name"],
+        "appointment_details": dict(details),
+        "confirmation_token": token,
+        "reason": user_data["reason"]
+    })
+    
+    print(f"[BOOKING] Email queued: {email_job_id}")
     
     return {
         "status": "success",
         "message": "Appointment slot reserved temporarily",
         "confirmation_token": token,
         "appointment_details": {
-            "id": appointment["id"],
-            "date": appointment["date"],
-            "time": appointment["time"],
-            "type": appointment["type"]
+            "id": appointment_id,
+            "date": details["date"],
+            "time": details["time"],
+            "type": details["type"]
         },
         "user_email": user_data["email"],
         "expires_in_minutes": 30,
-        "expires_at": expires_at.isoformat(),
-        "email_sent": email_result["status"] == "success" 
+        "expires_at": pending_confirmation["expires_at"],
+        "email_queued": True,
+        "email_job_id": email_job_id,
+        "speak": (
+            f"Your confirmation email is on its way to {user_data['email']}. "
+            "Click the link in it within 30 minutes to secure your spot."
+        )
     }
 
 
-async def book_appointment(token: str) -> Dict[str, Any]:
-    data = load_data()
+def _find_pending(token: str) -> Dict[str, Any]:
+    index = get_confirmation_index()
+    pending = index.get(token)
+    
+    if pending is None:
+        # Created by another process since our index was loaded
+        pending = get_backend().get_pending_confirmation(token)
+        if not pending or pending["status"] != "pending":
+            return None
+        index.add(pending)
+    
+    return pending
+
+
+def _find_confirmed_booking(token: str) -> Dict[str, Any]:
+    index = get_confirmation_index()
+    booking_id = index.get_booking_id(token)
+    
+    if booking_id is None:
+        confirmation = get_backend().get_pending_confirmation(token)
+        if not confirmation or confirmation["status"] != "confirmed":
+            return None
+        booking_id = confirmation.get("booking_id")
+        index.mark_confirmed(token, booking_id)
+    
+    booking = get_backend().get_booking(booking_id)
+    if not booking or booking["status"] != "confirmed":
+        # Cancelled since, the link must not resurrect it
+        return None
+    
+    return booking
+
+
+def _already_confirmed(booking: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "message": "Appointment already confirmed",
+        "booking": booking,
+        "already_confirmed": True
+    }
+
+
+def _confirm(token: str) -> Dict[str, Any]:
+    """Blocking part of a confirmation. Errors carry a machine-readable "reason"."""
+    backend = get_backend()
     
     # Find the pending confirmation
-    pending = None
-    pending_index = None
-    for idx, conf in enumerate(data["pending_confirmations"]):
-        if conf["token"] == token and conf["status"] == "pending":
-            pending = conf
-            pending_index = idx
-            break
+    pending = _find_pending(token)
     
     if not pending:
+        # Repeated clicks on the same link get the original booking back
+        existing = _find_confirmed_booking(token)
+        if existing:
+            return _already_confirmed(existing)
         return {
             "status": "error",
+            "reason": "invalid_token",
             "message": "Invalid or already used confirmation token"
         }
     
     # Check if token has expired
     expires_at = datetime.fromisoformat(pending["expires_at"])
     if datetime.now() > expires_at:
-        data["pending_confirmations"][pending_index]["status"] = "expired"
-        save_data(data)
+        backend.set_pending_status(token, "pending", "expired")
+        _release_hold(pending)
         return {
             "status": "error",
+            "reason": "expired",
             "message": "Confirmation token has expired. Please request a new appointment."
         }
     
-    appointment = None
-    appointment_index = None
-    for idx, apt in enumerate(data["appointments"]):
-        if apt["id"] == pending["appointment_id"]:
-            if not apt["available"]:
-                return {
-                    "status": "error",
-                    "message": "This appointment slot is no longer available"
-                }
-            appointment = apt
-            appointment_index = idx
-            break
+    appointment = backend.get_appointment(pending["appointment_id"])
     
     if not appointment:
         return {
             "status": "error",
+            "reason": "not_found",
             "message": "Appointment not found"
         }
     
-    data["appointments"][appointment_index]["available"] = False
-    
     booking_id = f"BKG_{secrets.token_hex(4).upper()}"
     
     booking = {
@@ -162,59 +215,67 @@ async def book_appointment(token: str) -> Dict[str, Any]:
         "status": "confirmed"
     }
     
-    data["bookings"].append(booking)
-    data["pending_confirmations"][pending_index]["status"] = "confirmed"
-    data["pending_confirmations"][pending_index]["booking_id"] = booking_id
-    
-    save_data(data)
+    # Atomic: only succeeds if the token is still pending and the slot still free
+    if not backend.confirm_booking(token, booking):
+        current = backend.get_pending_confirmation(token)
+        if not current or current["status"] != "pending":
+            get_confirmation_index().remove(token)
+            # A concurrent click on the same link won the race
+            existing = _find_confirmed_booking(token)
+            if existing:
+                return _already_confirmed(existing)
+            return {
+                "status": "error",
+                "reason": "invalid_token",
+                "message": "Invalid or already used confirmation token"
+            }
+        return {
+            "status": "error",
+            "reason": "unavailable",
+            "message": "This appointment slot is no longer available"
+        }
     
-    # ✅ AWAIT the booking confirmation email
-    email_result = await send_booking_confirmation_email(
-        recipient_email=pending["user_data"]["email"],
-        recipient_name=pending["user_data"]["name"],
-        booking_id=booking_id,
-        appointment_details=pending["appointment_details"],
-        reason=pending["user_data"]["reason"]
-    )
+    get_confirmation_index().mark_confirmed(token, booking_id)
+    get_slot_store().set_available(pending["appointment_id"], False)
     
     return {
         "status": "success",
         "message": "Appointment confirmed successfully!",
-        "booking": booking,
-        "email_sent": email_result["status"] == "success"
+        "booking": booking
     }
 
 
+async def book_appointment(token: str) -> Dict[str, Any]:
+    # Storage I/O runs off the event loop so /confirm does not stall the voice sessions
+    result = await asyncio.to_thread(_confirm, token)
+    
+    if result["status"] != "success" or result.get("already_confirmed"):
+        return result
+    
+    booking = result["booking"]
+    email_job_id = await enqueue_email("booking_confirmation", {
+        "recipient_email": booking["user_data"]["email"],
+        "recipient_name": booking["user_data"]["name"],
+        "booking_id": booking["booking_id"],
+        "appointment_details": booking["appointment_details"],
+        "reason": booking["user_data"]["reason"]
+    })
+    
+    result["email_queued"] = True
+    result["email_job_id"] = email_job_id
+    return result
+
+
 def get_pending_confirmation(token: str) -> Dict[str, Any]:
-    data = load_data()
-    
-    for conf in data["pending_confirmations"]:
-        if conf["token"] == token:
-            return conf
-    
-    return None
+    return get_backend().get_pending_confirmation(token)
 
 
 def get_booking_by_id(booking_id: str) -> Dict[str, Any]:
-    data = load_data()
-    
-    for booking in data["bookings"]:
-        if booking["booking_id"] == booking_id:
-            return booking
-    
-    return None
+    return get_backend().get_booking(booking_id)
 
 
 async def cancel_booking(booking_id: str) -> Dict[str, Any]:
-    data = load_data()
-    
-    booking = None
-    booking_index = None
-    for idx, bkg in enumerate(data["bookings"]):
-        if bkg["booking_id"] == booking_id and bkg["status"] == "confirmed":
-            booking = bkg
-            booking_index = idx
-            break
+    booking = await asyncio.to_thread(get_backend().cancel_booking, booking_id, datetime.now().isoformat())
     
     if not booking:
         return {
@@ -222,15 +283,7 @@ async def cancel_booking(booking_id: str) -> Dict[str, Any]:
             "message": "Booking not found or already cancelled"
         }
     
-    for apt in data["appointments"]:
-        if apt["id"] == booking["appointment_id"]:
-            apt["available"] = True
-            break
-    
-    data["bookings"][booking_index]["status"] = "cancelled"
-    data["bookings"][booking_index]["cancelled_at"] = datetime.now().isoformat()
-    
-    save_data(data)
+    get_slot_store().set_available(booking["appointment_id"], True)
     
     return {
         "status": "success",
@@ -239,19 +292,85 @@ async def cancel_booking(booking_id: str) -> Dict[str, Any]:
     }
 
 
+def _release_hold(pending: Dict[str, Any]) -> None:
+    get_confirmation_index().remove(pending["token"])
+    get_backend().release_hold(pending["appointment_id"], pending["token"])
+    get_slot_store().release_hold(pending["appointment_id"])
+
+
 def cleanup_expired_confirmations() -> int:
-    data = load_data()
-    now = datetime.now()
-    cleaned_count = 0
+    expired = get_confirmation_index().pop_expired()
+    
+    if not expired:
+        return 0
+    
+    # One bulk update for everything that came due, holds included
+    get_backend().expire_pending_confirmations(datetime.now().isoformat())
+    
+    for pending in expired:
+        get_slot_store().release_hold(pending["appointment_id"])
     
-    for conf in data["pending_confirmations"]:
-        if conf["status"] == "pending":
-            expires_at = datetime.fromisoformat(conf["expires_at"])
-            if now > expires_at:
-                conf["status"] = "expired"
-                cleaned_count += 1
+    return len(expired)
+
+
+async def run_expiry_sweeper(max_interval: float = EXPIRY_SWEEP_MAX_INTERVAL):
+    """Background task: expire pending confirmations as soon as they are due."""
+    while True:
+        try:
+            cleaned_count = await asyncio.to_thread(cleanup_expired_confirmations)
+            if cleaned_count:
+                print(f"[SWEEPER] Expired {cleaned_count} pending confirmations")
+        except Exception as e:
+            print(f"[SWEEPER ERROR] {str(e)}")
+        
+        delay = get_confirmation_index().seconds_until_next_expiry()
+        await asyncio.sleep(max_interval if delay is None else min(delay + 0.01, max_interval))
+
+
+async def test_concurrent_holds(reservers: int = 200):
+    """Load test: many coroutines race for one slot, exactly one may win"""
+    import tempfile
+    from pathlib import Path
+    from .storage import JsonFileBackend, SQLiteBackend
+    
+    appointment = {
+        "id": "apt_001",
+        "date": "2025-12-02",
+        "time": "09:00",
+        "available": True,
+        "type": "emergency_residence_permit"
+    }
     
-    if cleaned_count > 0:
-        save_data(data)
+    def confirmation(i: int) -> Dict[str, Any]:
+        created_at = datetime.now()
+        return {
+            "token": f"token_{i}",
+            "appointment_id": appointment["id"],
+            "user_data": {"name": "Load Test", "email": "load@test.com", "reason": "Concurrency test"},
+            "appointment_details": {k: appointment[k] for k in ("date", "time", "type")},
+            "created_at": created_at.isoformat(),
+            "expires_at": (created_at + timedelta(minutes=30)).isoformat(),
+            "status": "pending"
+        }
     
-    return cleaned_count
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in (SQLiteBackend(Path(tmp) / "data.db"), JsonFileBackend(Path(tmp) / "data.json")):
+            backend.save_all({"appointments": [appointment], "bookings": [], "pending_confirmations": []})
+            
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                asyncio.to_thread(backend.reserve_slot, confirmation(i))
+                for i in range(reservers)
+            ))
+            elapsed = time.perf_counter() - started
+            
+            winners = sum(results)
+            pending = [c for c in backend.load_all()["pending_confirmations"] if c["status"] == "pending"]
+            
+            print(f"[TEST] {type(backend).__name__}: {reservers} reservers, {winners} hold(s), "
+                  f"{len(pending)} pending, {elapsed * 1000:.0f} ms")
+            assert winners == 1 and len(pending) == 1, "double hold detected"
+
+
+if __name__ == "__main__":
+    asyncio.run(test_concurrent_holds())
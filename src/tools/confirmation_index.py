@@ -0,0 +1,116 @@
+""" In-memory indexes over pending confirmations: by token and by expiry time."""
+
+import heapq
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime
+from .data_manager import get_backend, ChangeWatcher
+
+
+class ConfirmationIndex:
+    """
+    Keeps every still-pending confirmation in a token hash and a min-heap
+    ordered by expiry, so lookups are O(1) and a sweep only touches the
+    entries that are actually due.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_token: Dict[str, Dict[str, Any]] = {}
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        # token -> booking_id for confirmed tokens, so repeated clicks are O(1)
+        self._confirmed: Dict[str, str] = {}
+        self._loaded = False
+        self._watcher = ChangeWatcher()
+
+    def load(self, data: Optional[Dict] = None) -> None:
+        self._watcher.mark()
+        if data is None:
+            data = get_backend().load_all()
+
+        with self._lock:
+            self._by_token = {}
+            self._expiry_heap = []
+            self._confirmed = {}
+            for conf in data.get("pending_confirmations", []):
+                if conf["status"] == "pending":
+                    self._insert(conf)
+                elif conf["status"] == "confirmed" and conf.get("booking_id"):
+                    self._confirmed[conf["token"]] = conf["booking_id"]
+            heapq.heapify(self._expiry_heap)
+            self._loaded = True
+
+    def _ensure_loaded(self) -> None:
+        # Picks up confirmations created by other workers
+        if not self._loaded or self._watcher.changed():
+            self.load()
+
+    def _insert(self, conf: Dict[str, Any]) -> None:
+        self._by_token[conf["token"]] = conf
+        self._expiry_heap.append((datetime.fromisoformat(conf["expires_at"]), conf["token"]))
+
+    def add(self, conf: Dict[str, Any]) -> None:
+        self._ensure_loaded()
+        with self._lock:
+            self._by_token[conf["token"]] = conf
+            heapq.heappush(self._expiry_heap, (datetime.fromisoformat(conf["expires_at"]), conf["token"]))
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """The pending confirmation for a token, or None if it is not pending here."""
+        self._ensure_loaded()
+        return self._by_token.get(token)
+
+    def remove(self, token: str) -> Optional[Dict[str, Any]]:
+        # The heap entry is left behind and skipped when it surfaces
+        self._ensure_loaded()
+        with self._lock:
+            return self._by_token.pop(token, None)
+
+    def mark_confirmed(self, token: str, booking_id: str) -> None:
+        self._ensure_loaded()
+        with self._lock:
+            self._by_token.pop(token, None)
+            self._confirmed[token] = booking_id
+
+    def get_booking_id(self, token: str) -> Optional[str]:
+        """Booking id of an already confirmed token."""
+        self._ensure_loaded()
+        return self._confirmed.get(token)
+
+    def pop_expired(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Remove and return every pending confirmation that expired by now."""
+        self._ensure_loaded()
+        now = now or datetime.now()
+        expired = []
+
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < now:
+                _, token = heapq.heappop(self._expiry_heap)
+                conf = self._by_token.pop(token, None)
+                if conf is not None:
+                    expired.append(conf)
+
+        return expired
+
+    def seconds_until_next_expiry(self, now: Optional[datetime] = None) -> Optional[float]:
+        self._ensure_loaded()
+        now = now or datetime.now()
+
+        with self._lock:
+            # Drop heap entries whose confirmation was already resolved
+            while self._expiry_heap and self._expiry_heap[0][1] not in self._by_token:
+                heapq.heappop(self._expiry_heap)
+            if not self._expiry_heap:
+                return None
+            return max(0.0, (self._expiry_heap[0][0] - now).total_seconds())
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._by_token)
+
+
+_confirmation_index = ConfirmationIndex()
+
+
+def get_confirmation_index() -> ConfirmationIndex:
+    return _confirmation_index
@@ -1,41 +1,92 @@
-""" Loading and saving the data to a json file."""
+""" Loading and saving the data through the configured storage backend."""
 
-import json
-from typing import Dict
+import os
+import time
+from typing import Dict, Any
 from pathlib import Path
+from .storage import StorageBackend, JsonFileBackend, SQLiteBackend, migrate_json_to_sqlite
 
 # Path to data file
 DATA_FILE = Path(__file__).parent.parent / "data" / "data.json"
+SQLITE_FILE = Path(os.getenv("SQLITE_DB_PATH", DATA_FILE.with_suffix(".db")))
+
+# "json" keeps the original single-document file, "sqlite" uses SQLite in WAL mode
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+
+# How often resident indexes check whether another worker wrote
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", 0.5))
+
+_backend: StorageBackend = None
+
+
+def create_backend(name: str = STORAGE_BACKEND) -> StorageBackend:
+
+    if name == "json":
+        return JsonFileBackend(DATA_FILE)
+
+    if name == "sqlite":
+        backend = SQLiteBackend(SQLITE_FILE)
+        # One-shot migration the first time the database is opened
+        if backend.is_empty() and DATA_FILE.exists():
+            counts = migrate_json_to_sqlite(DATA_FILE, SQLITE_FILE)
+            print(f"[STORAGE] Migrated {counts} from {DATA_FILE} to {SQLITE_FILE}")
+        return backend
+
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+def get_backend() -> StorageBackend:
+    global _backend
+
+    if _backend is None:
+        _backend = create_backend()
+
+    return _backend
+
+
+def set_backend(backend: StorageBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+class ChangeWatcher:
+    """
+    Tells a resident index when the backend was written by someone else
+    (another worker process), checking at most every STATE_SYNC_INTERVAL.
+    """
+
+    def __init__(self, interval: float = STATE_SYNC_INTERVAL):
+        self.interval = interval
+        self._token: Any = None
+        self._checked_at = 0.0
+
+    def mark(self) -> None:
+        """Call right before (re)loading from the backend."""
+        self._token = get_backend().change_token()
+        self._checked_at = time.monotonic()
+
+    def changed(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < self.interval:
+            return False
+        self._checked_at = now
+        backend = get_backend()
+        token = backend.change_token()
+        if token is None:
+            return False
+        # Our own writes were already applied to the index in place
+        self._token = backend.follow_local_writes(self._token)
+        return token != self._token
 
 
 def load_data() -> Dict:
-    
-    try:
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-        
-    except FileNotFoundError:
-
-        initial_data = {
-            "appointments": [],
-            "bookings": [],
-            "pending_confirmations": []
-        }
-        
-        save_data(initial_data)
-        
-        return initial_data
-    
-    except json.JSONDecodeError as e:
-        
-        raise ValueError(f"Invalid JSON in data file: {str(e)}")
+
+    return get_backend().load_all()
 
 
 def save_data(data: Dict) -> None:
-    DATA_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    get_backend().save_all(data)
 
 
 def get_data_file_path() -> Path:
@@ -0,0 +1,265 @@
+""" Durable outbox so booking tools return before SMTP finishes."""
+
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+import uuid
+from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta
+from pathlib import Path
+from .email_service import (
+    send_confirmation_email,
+    send_booking_confirmation_email,
+    send_emails_batch,
+)
+
+OUTBOX_FILE = Path(os.getenv("EMAIL_OUTBOX_PATH", Path(__file__).parent.parent / "data" / "outbox.db"))
+OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("EMAIL_OUTBOX_BACKOFF_SECONDS", 2))
+OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", 5))
+# A job still 'sending' after this long belongs to a worker that died
+OUTBOX_LEASE_SECONDS = float(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", 300))
+# Due jobs of one kind a worker claims and renders together
+OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 10))
+
+EMAIL_SENDERS = {
+    "confirmation": send_confirmation_email,
+    "booking_confirmation": send_booking_confirmation_email,
+}
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    sent_at TEXT,
+    claimed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON email_outbox (status, next_attempt_at);
+"""
+
+
+class EmailOutbox:
+    """
+    Emails are written to SQLite before the tool returns and delivered by
+    background workers with exponential backoff, so a crash or an SMTP
+    outage does not lose them.
+    """
+
+    def __init__(self, path: Path = OUTBOX_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(OUTBOX_SCHEMA)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+        # Outboxes created before leases existed
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(email_outbox)")}
+        if "claimed_at" not in columns:
+            self._conn.execute("ALTER TABLE email_outbox ADD COLUMN claimed_at TEXT")
+
+    def _insert_job(self, job_id: str, kind: str, payload: Dict[str, Any]) -> None:
+        now = datetime.now().isoformat()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO email_outbox (id, kind, payload, status, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in EMAIL_SENDERS:
+            raise ValueError(f"Unknown email kind: {kind}")
+
+        job_id = f"EML_{uuid.uuid4().hex[:12].upper()}"
+        await asyncio.to_thread(self._insert_job, job_id, kind, payload)
+
+        self.ensure_workers()
+        if self._wakeup:
+            self._wakeup.set()
+
+        return job_id
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, attempts, last_error, created_at, sent_at "
+                "FROM email_outbox WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+
+        return dict(row) if row else None
+
+    def _claim_due_jobs(self, limit: int = OUTBOX_BATCH_SIZE) -> List[Dict[str, Any]]:
+        """
+        Lease up to `limit` due jobs of the same kind. Other workers (and
+        other processes sharing the outbox) skip them until the lease runs
+        out, so a job whose worker died mid-send is retried but a live send
+        is never duplicated.
+        """
+        now = datetime.now()
+        claimed_at = now.isoformat()
+        lease_expired = (now - timedelta(seconds=OUTBOX_LEASE_SECONDS)).isoformat()
+        due = "((status = 'queued' AND next_attempt_at <= ?) OR (status = 'sending' AND (claimed_at IS NULL OR claimed_at <= ?)))"
+        claimed = []
+
+        with self._lock:
+            first = self._conn.execute(
+                f"SELECT kind FROM email_outbox WHERE {due} ORDER BY next_attempt_at LIMIT 1",
+                (claimed_at, lease_expired)
+            ).fetchone()
+            if first is None:
+                return []
+
+            rows = self._conn.execute(
+                f"SELECT * FROM email_outbox WHERE kind = ? AND {due} ORDER BY next_attempt_at LIMIT ?",
+                (first["kind"], claimed_at, lease_expired, limit)
+            ).fetchall()
+
+            for row in rows:
+                # Conditional, so only one process wins each job
+                cursor = self._conn.execute(
+                    "UPDATE email_outbox SET status = 'sending', claimed_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ? AND (status = 'queued' OR (status = 'sending' AND (claimed_at IS NULL OR claimed_at <= ?)))",
+                    (claimed_at, row["id"], lease_expired)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(row)
+
+        jobs = []
+        for row in claimed:
+            if row["status"] == "sending":
+                print(f"[OUTBOX] Reclaiming {row['id']}, its lease from {row['claimed_at']} expired")
+
+            job = dict(row)
+            job["attempts"] += 1
+            job["claimed_at"] = claimed_at
+            job["payload"] = json.loads(job["payload"])
+            jobs.append(job)
+
+        return jobs
+
+    def _finish_job(self, job: Dict[str, Any], result: Dict[str, Any]) -> None:
+        with self._lock:
+            if result.get("status") == "success":
+                self._conn.execute(
+                    "UPDATE email_outbox SET status = 'sent', sent_at = ?, last_error = NULL "
+                    "WHERE id = ? AND claimed_at = ?",
+                    (datetime.now().isoformat(), job["id"], job["claimed_at"])
+                )
+                return
+
+            error = result.get("message", "Unknown error")
+
+            if job["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+                self._conn.execute(
+                    "UPDATE email_outbox SET status = 'failed', last_error = ? WHERE id = ? AND claimed_at = ?",
+                    (error, job["id"], job["claimed_at"])
+                )
+                print(f"[OUTBOX] Giving up on {job['id']} after {job['attempts']} attempts: {error}")
+                return
+
+            delay = OUTBOX_BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+            next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+            self._conn.execute(
+                "UPDATE email_outbox SET status = 'queued', next_attempt_at = ?, last_error = ? "
+                "WHERE id = ? AND claimed_at = ?",
+                (next_attempt_at, error, job["id"], job["claimed_at"])
+            )
+            print(f"[OUTBOX] Retrying {job['id']} in {delay:g}s: {error}")
+
+    async def _send_jobs(self, kind: str, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        sender = EMAIL_SENDERS[kind]
+        if len(jobs) > 1:
+            try:
+                return await send_emails_batch(kind, [job["payload"] for job in jobs])
+            except Exception as e:
+                # One bad payload fails the whole render; send one by one so it only fails itself
+                print(f"[OUTBOX] Batch of {len(jobs)} {kind} emails failed to render, sending singly: {str(e)}")
+
+        results = []
+        for job in jobs:
+            try:
+                results.append(await sender(**job["payload"]))
+            except Exception as e:
+                results.append({"status": "error", "message": str(e)})
+        return results
+
+    async def process_one(self) -> bool:
+        """Deliver one burst of due jobs. Returns False when nothing was due."""
+        jobs = await asyncio.to_thread(self._claim_due_jobs)
+        if not jobs:
+            return False
+
+        results = await self._send_jobs(jobs[0]["kind"], jobs)
+
+        for job, result in zip(jobs, results):
+            await asyncio.to_thread(self._finish_job, job, result)
+        return True
+
+    async def _worker(self):
+        while True:
+            try:
+                if await self.process_one():
+                    continue
+            except Exception as e:
+                print(f"[OUTBOX ERROR] {str(e)}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def ensure_workers(self, count: int = OUTBOX_WORKERS) -> None:
+        """Start the workers on the running loop, if there is one."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        self._workers = [task for task in self._workers if not task.done()]
+        if self._workers:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(count)]
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+_outbox: Optional[EmailOutbox] = None
+
+
+def get_email_outbox() -> EmailOutbox:
+    global _outbox
+
+    if _outbox is None:
+        _outbox = EmailOutbox()
+
+    return _outbox
+
+
+async def enqueue_email(kind: str, payload: Dict[str, Any]) -> str:
+    return await get_email_outbox().enqueue(kind, payload)
+
+
+def get_email_status(job_id: str) -> Optional[Dict[str, Any]]:
+    return get_email_outbox().get_status(job_id)
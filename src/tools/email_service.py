@@ -1,13 +1,13 @@
 import os
 import asyncio
-import aiosmtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Dict, Any
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 from pathlib import Path
 from jinja2 import Environment, FileSystemLoader
 from dotenv import load_dotenv
+from .smtp_pool import SMTPConnectionPool
 
 load_dotenv()
 
@@ -19,9 +19,52 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", SMTP_USERNAME)
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
 
+# Re-read templates from disk when they change (dev only)
+EMAIL_TEMPLATES_AUTO_RELOAD = os.getenv("EMAIL_TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
+
 # Setup Jinja2 template environment
 TEMPLATE_DIR = Path(__file__).parent / "email_templates"
-jinja_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+jinja_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    auto_reload=EMAIL_TEMPLATES_AUTO_RELOAD
+)
+
+# (text template, html template) per email kind
+EMAIL_TEMPLATES = {
+    "confirmation": ("confirmation_email.txt", "confirmation_email.html"),
+    "booking_confirmation": ("booking_confirmation.txt", "booking_confirmation.html"),
+}
+
+# Compiled once at import
+_compiled_templates = {
+    name: jinja_env.get_template(name)
+    for names in EMAIL_TEMPLATES.values()
+    for name in names
+}
+
+_smtp_pool: Optional[SMTPConnectionPool] = None
+
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    global _smtp_pool
+    
+    if _smtp_pool is None:
+        _smtp_pool = SMTPConnectionPool(
+            hostname=SMTP_HOST,
+            port=SMTP_PORT,
+            username=SMTP_USERNAME,
+            password=SMTP_PASSWORD
+        )
+    
+    return _smtp_pool
+
+
+async def close_smtp_pool():
+    global _smtp_pool
+    
+    if _smtp_pool is not None:
+        await _smtp_pool.close()
+        _smtp_pool = None
 
 
 def format_datetime_for_email(date_str: str, time_str: str) -> tuple:
@@ -34,6 +77,172 @@ def format_datetime_for_email(date_str: str, time_str: str) -> tuple:
     return readable_date, readable_time
 
 
+def get_email_template(name: str):
+    if EMAIL_TEMPLATES_AUTO_RELOAD:
+        # Jinja checks the file's mtime and recompiles only when it changed
+        return jinja_env.get_template(name)
+    return _compiled_templates[name]
+
+
+def render_email(kind: str, context: Dict[str, Any]) -> Tuple[str, str]:
+    text_name, html_name = EMAIL_TEMPLATES[kind]
+    return (
+        get_email_template(text_name).render(context),
+        get_email_template(html_name).render(context)
+    )
+
+
+def render_emails(kind: str, contexts: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Render many recipients' emails of one kind in a single pass."""
+    text_name, html_name = EMAIL_TEMPLATES[kind]
+    text_template = get_email_template(text_name)
+    html_template = get_email_template(html_name)
+    
+    return [
+        (text_template.render(context), html_template.render(context))
+        for context in contexts
+    ]
+
+
+def build_mime_message(
+    recipient_email: str,
+    subject: str,
+    text_content: str,
+    html_content: str
+) -> MIMEMultipart:
+    message = MIMEMultipart("alternative")
+    message["From"] = f"KVR Munich <{SENDER_EMAIL}>"
+    message["To"] = recipient_email
+    message["Subject"] = subject
+    
+    # Attach both versions
+    message.attach(MIMEText(text_content, "plain", "utf-8"))
+    message.attach(MIMEText(html_content, "html", "utf-8"))
+    
+    return message
+
+
+def confirmation_email_context(
+    recipient_name: str,
+    appointment_details: Dict[str, str],
+    confirmation_token: str,
+    reason: str
+) -> Dict[str, Any]:
+    readable_date, readable_time = format_datetime_for_email(
+        appointment_details["date"],
+        appointment_details["time"]
+    )
+    
+    return {
+        "recipient_name": recipient_name,
+        "readable_date": readable_date,
+        "readable_time": readable_time,
+        "reason": reason,
+        "confirmation_url": f"{BASE_URL}/confirm?token={confirmation_token}"
+    }
+
+
+def booking_confirmation_context(
+    recipient_name: str,
+    booking_id: str,
+    appointment_details: Dict[str, str],
+    reason: str
+) -> Dict[str, Any]:
+    readable_date, readable_time = format_datetime_for_email(
+        appointment_details["date"],
+        appointment_details["time"]
+    )
+    
+    return {
+        "recipient_name": recipient_name,
+        "booking_id": booking_id,
+        "readable_date": readable_date,
+        "readable_time": readable_time,
+        "reason": reason
+    }
+
+
+def build_confirmation_message(
+    recipient_email: str,
+    recipient_name: str,
+    appointment_details: Dict[str, str],
+    confirmation_token: str,
+    reason: str
+) -> MIMEMultipart:
+    context = confirmation_email_context(recipient_name, appointment_details, confirmation_token, reason)
+    text_content, html_content = render_email("confirmation", context)
+    
+    return build_mime_message(
+        recipient_email,
+        "⚠️ Confirm Your KVR Emergency Appointment",
+        text_content,
+        html_content
+    )
+
+
+def build_booking_confirmation_message(
+    recipient_email: str,
+    recipient_name: str,
+    booking_id: str,
+    appointment_details: Dict[str, str],
+    reason: str
+) -> MIMEMultipart:
+    context = booking_confirmation_context(recipient_name, booking_id, appointment_details, reason)
+    text_content, html_content = render_email("booking_confirmation", context)
+    
+    return build_mime_message(
+        recipient_email,
+        f"✅ Appointment Confirmed - Booking #{booking_id}",
+        text_content,
+        html_content
+    )
+
+
+MESSAGE_BUILDERS = {
+    "confirmation": build_confirmation_message,
+    "booking_confirmation": build_booking_confirmation_message,
+}
+
+
+async def build_messages_batch(kind: str, items: List[Dict[str, Any]]) -> List[MIMEMultipart]:
+    """Render and assemble a burst of emails in one worker-thread hop."""
+    builder = MESSAGE_BUILDERS[kind]
+    
+    def build_all():
+        return [builder(**item) for item in items]
+    
+    return await asyncio.to_thread(build_all)
+
+
+async def send_emails_batch(kind: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Send a burst of same-kind emails: all messages are rendered in one
+    thread hop, then sent concurrently over the pool (at most its size in
+    flight). One result per item, in order.
+    """
+    messages = await build_messages_batch(kind, items)
+    
+    async def send(message: MIMEMultipart) -> Dict[str, Any]:
+        recipient = message["To"]
+        try:
+            await get_smtp_pool().send(message)
+            print(f"[EMAIL] {kind} email sent to {recipient}")
+            return {
+                "status": "success",
+                "message": "Email sent successfully",
+                "recipient": recipient
+            }
+        except Exception as e:
+            print(f"[EMAIL ERROR] {str(e)}")
+            return {
+                "status": "error",
+                "message": f"Failed to send email: {str(e)}",
+                "recipient": recipient
+            }
+    
+    return list(await asyncio.gather(*(send(message) for message in messages)))
+
+
 async def send_confirmation_email(
     recipient_email: str,
     recipient_name: str,
@@ -43,53 +252,18 @@ async def send_confirmation_email(
 ) -> Dict[str, Any]:
     """Send confirmation email - fully async"""
     try:
-        # Format date and time
-        readable_date, readable_time = format_datetime_for_email(
-            appointment_details["date"],
-            appointment_details["time"]
+        # Rendering and MIME assembly run off the event loop
+        message = await asyncio.to_thread(
+            build_confirmation_message,
+            recipient_email,
+            recipient_name,
+            appointment_details,
+            confirmation_token,
+            reason
         )
         
-        # Build confirmation URL
-        confirmation_url = f"{BASE_URL}/confirm?token={confirmation_token}"
-        
-        # Prepare template context
-        context = {
-            "recipient_name": recipient_name,
-            "readable_date": readable_date,
-            "readable_time": readable_time,
-            "reason": reason,
-            "confirmation_url": confirmation_url
-        }
-        
-        # Load and render templates
-        text_template = jinja_env.get_template("confirmation_email.txt")
-        html_template = jinja_env.get_template("confirmation_email.html")
-        
-        text_content = text_template.render(context)
-        html_content = html_template.render(context)
-        
-        # Create message
-        message = MIMEMultipart("alternative")
-        message["From"] = f"KVR Munich <{SENDER_EMAIL}>"
-        message["To"] = recipient_email
-        message["Subject"] = "⚠️ Confirm Your KVR Emergency Appointment"
-        
-        # Attach both versions
-        text_part = MIMEText(text_content, "plain", "utf-8")
-        html_part = MIMEText(html_content, "html", "utf-8")
-        
-        message.attach(text_part)
-        message.attach(html_part)
-        
-        # Send email using aiosmtplib
-        await aiosmtplib.send(
-            message,
-            hostname=SMTP_HOST,
-            port=SMTP_PORT,
-            username=SMTP_USERNAME,
-            password=SMTP_PASSWORD,
-            start_tls=True
-        )
+        # Send over a pooled, already authenticated connection
+        await get_smtp_pool().send(message)
         
         print(f"[EMAIL] Confirmation sent to {recipient_email}")
         
@@ -117,50 +291,18 @@ async def send_booking_confirmation_email(
 ) -> Dict[str, Any]:
     """Send booking confirmation - fully async"""
     try:
-        # Format date and time
-        readable_date, readable_time = format_datetime_for_email(
-            appointment_details["date"],
-            appointment_details["time"]
+        # Rendering and MIME assembly run off the event loop
+        message = await asyncio.to_thread(
+            build_booking_confirmation_message,
+            recipient_email,
+            recipient_name,
+            booking_id,
+            appointment_details,
+            reason
         )
         
-        # Prepare template context
-        context = {
-            "recipient_name": recipient_name,
-            "booking_id": booking_id,
-            "readable_date": readable_date,
-            "readable_time": readable_time,
-            "reason": reason
-        }
-        
-        # Load and render templates
-        text_template = jinja_env.get_template("booking_confirmation.txt")
-        html_template = jinja_env.get_template("booking_confirmation.html")
-        
-        text_content = text_template.render(context)
-        html_content = html_template.render(context)
-        
-        # Create message
-        message = MIMEMultipart("alternative")
-        message["From"] = f"KVR Munich <{SENDER_EMAIL}>"
-        message["To"] = recipient_email
-        message["Subject"] = f"✅ Appointment Confirmed - Booking #{booking_id}"
-        
-        # Attach both versions
-        text_part = MIMEText(text_content, "plain", "utf-8")
-        html_part = MIMEText(html_content, "html", "utf-8")
-        
-        message.attach(text_part)
-        message.attach(html_part)
-        
-        # Send email
-        await aiosmtplib.send(
-            message,
-            hostname=SMTP_HOST,
-            port=SMTP_PORT,
-            username=SMTP_USERNAME,
-            password=SMTP_PASSWORD,
-            start_tls=True
-        )
+        # Send over a pooled, already authenticated connection
+        await get_smtp_pool().send(message)
         
         print(f"[EMAIL] Booking confirmation sent to {recipient_email}")
         
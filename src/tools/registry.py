@@ -0,0 +1,214 @@
+""" Tool registry: calling convention and argument validators resolved once at registration."""
+
+import os
+import re
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable
+
+# Threads for blocking sync tools, so they never stall the event loop
+TOOL_THREAD_POOL_SIZE = int(os.getenv("TOOL_THREAD_POOL_SIZE", 4))
+
+JSON_TYPES = {
+    "string": str,
+    "object": dict,
+    "array": list,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float),
+}
+
+Validator = Callable[[Any, str, List[str]], None]
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """
+    Turn the JSON schema subset used in TOOLS_SCHEMA into a closure that
+    appends error strings for `value` at `path`. Patterns are compiled here,
+    not per call.
+    """
+    checks: List[Validator] = []
+
+    expected = schema.get("type")
+    if expected:
+        python_type = JSON_TYPES[expected]
+
+        def check_type(value, path, errors):
+            # bool is an int subclass, but not a JSON integer
+            if not isinstance(value, python_type) or (isinstance(value, bool) and expected != "boolean"):
+                errors.append(f"{path}: expected {expected}")
+                return False
+            return True
+    else:
+        def check_type(value, path, errors):
+            return True
+
+    if "pattern" in schema:
+        pattern = re.compile(schema["pattern"])
+
+        def check_pattern(value, path, errors):
+            if not pattern.search(value):
+                errors.append(f"{path}: does not match {pattern.pattern}")
+
+        checks.append(check_pattern)
+
+    if "minItems" in schema:
+        min_items = schema["minItems"]
+
+        def check_min_items(value, path, errors):
+            if len(value) < min_items:
+                errors.append(f"{path}: needs at least {min_items} item(s)")
+
+        checks.append(check_min_items)
+
+    if "items" in schema:
+        item_validator = compile_schema(schema["items"])
+
+        def check_items(value, path, errors):
+            for index, item in enumerate(value):
+                item_validator(item, f"{path}[{index}]", errors)
+
+        checks.append(check_items)
+
+    if "properties" in schema or "required" in schema:
+        properties = {
+            name: compile_schema(property_schema)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+        required = tuple(schema.get("required", ()))
+
+        def check_properties(value, path, errors):
+            for name in required:
+                if value.get(name) is None:
+                    errors.append(f"{path}.{name}: is required")
+            for name, property_validator in properties.items():
+                # None is how callers leave an optional field out
+                if value.get(name) is not None:
+                    property_validator(value[name], f"{path}.{name}", errors)
+
+        checks.append(check_properties)
+
+    def validate(value, path, errors):
+        if check_type(value, path, errors):
+            for check in checks:
+                check(value, path, errors)
+
+    return validate
+
+
+class Tool:
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable,
+        parameters_schema: Optional[Dict[str, Any]] = None,
+        blocking: bool = True
+    ):
+        self.name = name
+        self.function = function
+        self.is_async = inspect.iscoroutinefunction(function)
+        # Sync tools that only touch memory run inline; the rest go to the pool
+        self.blocking = blocking and not self.is_async
+
+        signature = inspect.signature(function)
+        self.accepts_any = any(p.kind is p.VAR_KEYWORD for p in signature.parameters.values())
+        self.parameter_names = frozenset(signature.parameters)
+        self.required_parameters = tuple(
+            name for name, p in signature.parameters.items()
+            if p.default is p.empty and p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)
+        )
+        self._validate_schema = compile_schema(parameters_schema) if parameters_schema else None
+
+    def validate(self, arguments: Any) -> List[str]:
+        if not isinstance(arguments, dict):
+            return ["arguments: expected object"]
+
+        errors = []
+        if self._validate_schema:
+            self._validate_schema(arguments, "arguments", errors)
+
+        for name in self.required_parameters:
+            if name not in arguments and f"arguments.{name}: is required" not in errors:
+                errors.append(f"arguments.{name}: is required")
+
+        if not self.accepts_any:
+            for name in arguments:
+                if name not in self.parameter_names:
+                    errors.append(f"arguments.{name}: unexpected argument")
+
+        return errors
+
+
+class ToolRegistry:
+
+    def __init__(self, max_workers: int = TOOL_THREAD_POOL_SIZE):
+        self._tools: Dict[str, Tool] = {}
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def register(
+        self,
+        function: Callable,
+        name: Optional[str] = None,
+        parameters_schema: Optional[Dict[str, Any]] = None,
+        blocking: bool = True
+    ) -> Tool:
+        tool = Tool(name or function.__name__, function, parameters_schema, blocking)
+        self._tools[tool.name] = tool
+        return tool
+
+    def register_schemas(self, functions: Dict[str, Callable], tools_schema: List[Dict], inline: tuple = ()):
+        schemas = {tool["function"]["name"]: tool["function"].get("parameters") for tool in tools_schema}
+        for name, function in functions.items():
+            self.register(function, name, schemas.get(name), blocking=name not in inline)
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self._tools.get(name)
+
+    def functions(self) -> Dict[str, Callable]:
+        return {name: tool.function for name, tool in self._tools.items()}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="tool")
+        return self._executor
+
+    async def execute(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        tool = self._tools.get(name)
+
+        if not tool:
+            return {
+                "status": "error",
+                "message": f"Function '{name}' not found"
+            }
+
+        errors = tool.validate(arguments)
+        if errors:
+            return {
+                "status": "error",
+                "message": f"Invalid arguments for {name}",
+                "errors": errors
+            }
+
+        try:
+            if tool.is_async:
+                return await tool.function(**arguments)
+            if tool.blocking:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), lambda: tool.function(**arguments))
+            return tool.function(**arguments)
+
+        except Exception as e:
+            print(f"[ERROR] Tool {name} failed: {type(e).__name__}: {e}")
+            return {
+                "status": "error",
+                "message": f"Error executing function: {str(e)}",
+                "exception_type": type(e).__name__
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,156 @@
+""" Resident, indexed view of the appointment slots."""
+
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Set
+from collections import defaultdict
+from .data_manager import load_data, ChangeWatcher
+
+
+class SlotStore:
+    """
+    Loads the appointments once and keeps them indexed by id, by date and by
+    the available flag so that availability queries never touch disk.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_date: Dict[str, List[str]] = defaultdict(list)
+        self._available: Set[str] = set()
+        # Temporary holds from reserve_slot_temporarily: id -> held until
+        self._holds: Dict[str, datetime] = {}
+        self._loaded = False
+        self._watcher = ChangeWatcher()
+        # Bumped whenever availability changes, so caches can tell they are stale
+        self._generation = 0
+        self._date_versions: Dict[str, int] = defaultdict(int)
+
+    def load(self, data: Optional[Dict] = None) -> None:
+        """(Re)build all indexes from a data document, reading it if not given."""
+        self._watcher.mark()
+        if data is None:
+            data = load_data()
+
+        with self._lock:
+            self._by_id = {}
+            self._by_date = defaultdict(list)
+            self._available = set()
+            self._holds = {}
+
+            for appointment in data.get("appointments", []):
+                self._index(dict(appointment))
+
+            for ids in self._by_date.values():
+                ids.sort(key=lambda apt_id: self._by_id[apt_id]["time"])
+
+            self._generation += 1
+            self._loaded = True
+
+    def _index(self, appointment: Dict[str, Any]) -> None:
+        apt_id = appointment["id"]
+        self._by_id[apt_id] = appointment
+        self._by_date[appointment["date"]].append(apt_id)
+        if appointment["available"]:
+            self._available.add(apt_id)
+        if appointment.get("held_until"):
+            self._holds[apt_id] = datetime.fromisoformat(appointment["held_until"])
+
+    def _is_free(self, appointment_id: str, now: datetime) -> bool:
+        if appointment_id not in self._available:
+            return False
+        held_until = self._holds.get(appointment_id)
+        return held_until is None or held_until <= now
+
+    def _ensure_loaded(self) -> None:
+        # Other workers write to the same backend; their changes bump the generation
+        if not self._loaded or self._watcher.changed():
+            self.load()
+
+    def get(self, appointment_id: str) -> Optional[Dict[str, Any]]:
+        self._ensure_loaded()
+        appointment = self._by_id.get(appointment_id)
+        return dict(appointment) if appointment else None
+
+    def is_available(self, appointment_id: str) -> bool:
+        """Available and not held by a pending confirmation."""
+        self._ensure_loaded()
+        return self._is_free(appointment_id, datetime.now())
+
+    def version_of(self, dates: List[str]) -> tuple:
+        """Changes whenever availability on any of these dates changes."""
+        self._ensure_loaded()
+        with self._lock:
+            return (self._generation,) + tuple(self._date_versions.get(date, 0) for date in dates)
+
+    def dates(self) -> List[str]:
+        """Every date that has slots, available or not, sorted."""
+        self._ensure_loaded()
+        with self._lock:
+            return sorted(self._by_date)
+
+    def available_on(self, date: str) -> List[Dict[str, Any]]:
+        """Available slots for one date, sorted by time."""
+        self._ensure_loaded()
+        now = datetime.now()
+        with self._lock:
+            return [
+                dict(self._by_id[apt_id])
+                for apt_id in self._by_date.get(date, [])
+                if self._is_free(apt_id, now)
+            ]
+
+    def available_on_dates(self, dates: List[str]) -> List[Dict[str, Any]]:
+        """Available slots for several dates, sorted by (date, time)."""
+        slots = []
+        for date in sorted(set(dates)):
+            slots.extend(self.available_on(date))
+        return slots
+
+    def available_from(self, start_date: str) -> List[Dict[str, Any]]:
+        """All available slots on or after start_date, sorted by (date, time)."""
+        self._ensure_loaded()
+        with self._lock:
+            dates = sorted(d for d in self._by_date if d >= start_date)
+        return self.available_on_dates(dates)
+
+    def set_available(self, appointment_id: str, available: bool) -> None:
+        """Update the available flag of a slot after it was persisted."""
+        self._ensure_loaded()
+        with self._lock:
+            appointment = self._by_id.get(appointment_id)
+            if appointment is None:
+                return
+            if appointment["available"] != available:
+                self._date_versions[appointment["date"]] += 1
+            appointment["available"] = available
+            self._holds.pop(appointment_id, None)
+            if available:
+                self._available.add(appointment_id)
+            else:
+                self._available.discard(appointment_id)
+
+    def set_hold(self, appointment_id: str, held_until: str) -> None:
+        """Record a hold after it was acquired in the backend."""
+        self._ensure_loaded()
+        with self._lock:
+            appointment = self._by_id.get(appointment_id)
+            if appointment is None:
+                return
+            self._holds[appointment_id] = datetime.fromisoformat(held_until)
+            self._date_versions[appointment["date"]] += 1
+
+    def release_hold(self, appointment_id: str) -> None:
+        self._ensure_loaded()
+        with self._lock:
+            appointment = self._by_id.get(appointment_id)
+            if appointment is None or self._holds.pop(appointment_id, None) is None:
+                return
+            self._date_versions[appointment["date"]] += 1
+
+
+_slot_store = SlotStore()
+
+
+def get_slot_store() -> SlotStore:
+    return _slot_store
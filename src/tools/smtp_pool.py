@@ -0,0 +1,205 @@
+""" Pool of authenticated SMTP connections reused across messages."""
+
+import os
+import time
+import asyncio
+from typing import Optional, List, Set
+from email.message import Message, EmailMessage
+import aiosmtplib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", 60))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+
+
+class PooledSMTPConnection:
+
+    def __init__(self, client: aiosmtplib.SMTP):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.messages_sent = 0
+
+    def is_stale(self) -> bool:
+        return (
+            not self.client.is_connected
+            or time.monotonic() - self.last_used > SMTP_IDLE_TIMEOUT
+            or self.messages_sent >= SMTP_MAX_MESSAGES_PER_CONNECTION
+        )
+
+    async def close(self):
+        try:
+            await self.client.quit()
+        except Exception:
+            self.client.close()
+
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` logged-in connections. Each send borrows one, so at
+    most `size` messages are in flight; idle or overused connections are
+    replaced, and a send that hits a dropped connection is retried once on a
+    fresh one.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        size: int = SMTP_POOL_SIZE,
+        start_tls: bool = True
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.size = size
+        self._idle: List[PooledSMTPConnection] = []
+        self._semaphore = asyncio.Semaphore(size)
+        # QUITs of retired connections still running in the background
+        self._closing: Set[asyncio.Task] = set()
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    async def _open(self) -> PooledSMTPConnection:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            start_tls=self.start_tls
+        )
+        await client.connect()
+        if self.username:
+            await client.login(self.username, self.password)
+        self.connections_opened += 1
+        return PooledSMTPConnection(client)
+
+    async def _acquire(self) -> PooledSMTPConnection:
+        while self._idle:
+            connection = self._idle.pop()
+            if not connection.is_stale():
+                return connection
+            await connection.close()
+        return await self._open()
+
+    def _release(self, connection: PooledSMTPConnection):
+        connection.last_used = time.monotonic()
+        if len(self._idle) < self.size and not connection.is_stale():
+            self._idle.append(connection)
+        else:
+            task = asyncio.create_task(connection.close())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def send(self, message: Message):
+        async with self._semaphore:
+            connection = await self._acquire()
+            try:
+                response = await connection.client.send_message(message)
+            except aiosmtplib.SMTPServerDisconnected:
+                # The server dropped an idle connection, retry on a fresh one
+                connection.client.close()
+                connection = await self._open()
+                try:
+                    response = await connection.client.send_message(message)
+                except Exception:
+                    connection.client.close()
+                    raise
+            except Exception:
+                connection.client.close()
+                raise
+
+            connection.messages_sent += 1
+            self.messages_sent += 1
+            self._release(connection)
+            return response
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await connection.close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+
+async def test_smtp_pool(port: int = 8025):
+    """Against a local aiosmtpd server: reuse, reconnect after a drop, no leak when the retry fails."""
+    from aiosmtpd.controller import Controller
+
+    class Handler:
+        def __init__(self):
+            self.messages = []
+
+        async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+            if address.startswith("reject"):
+                return "550 Mailbox unavailable"
+            envelope.rcpt_tos.append(address)
+            return "250 OK"
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(envelope)
+            return "250 Message accepted for delivery"
+
+    def message(recipient: str) -> EmailMessage:
+        msg = EmailMessage()
+        msg["From"] = "kvr@example.com"
+        msg["To"] = recipient
+        msg["Subject"] = "Pool test"
+        msg.set_content("Hello")
+        return msg
+
+    handler = Handler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+
+    pool = SMTPConnectionPool("127.0.0.1", port, None, None, size=3, start_tls=False)
+    opened: List[PooledSMTPConnection] = []
+    open_connection = pool._open
+
+    async def tracked_open():
+        connection = await open_connection()
+        opened.append(connection)
+        return connection
+
+    pool._open = tracked_open
+
+    try:
+        await asyncio.gather(*(pool.send(message(f"user{i}@example.com")) for i in range(10)))
+        assert len(handler.messages) == 10
+        assert pool.connections_opened <= 3, pool.connections_opened
+        print(f"[TEST] 10 messages over {pool.connections_opened} connections")
+
+        # Server restart: idle connections are dead, the send retries on a fresh one
+        controller.stop()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        opened_before = pool.connections_opened
+        await pool.send(message("after-restart@example.com"))
+        assert len(handler.messages) == 11
+        assert pool.connections_opened == opened_before + 1
+        print("[TEST] Reconnected after the server dropped the connection")
+
+        # Drop again, and have the retry itself fail: the fresh connection must be closed
+        controller.stop()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        try:
+            await pool.send(message("reject@example.com"))
+            raise AssertionError("rejected recipient was accepted")
+        except aiosmtplib.SMTPRecipientsRefused:
+            pass
+        leaked = [c for c in opened if c.client.is_connected and c not in pool._idle]
+        assert not leaked, f"{len(leaked)} connection(s) left open"
+        print("[TEST] Failed retry closed its connection")
+    finally:
+        await pool.close()
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(test_smtp_pool())
+
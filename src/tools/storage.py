@@ -0,0 +1,575 @@
+""" Storage backends behind the load_data/save_data API."""
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+from pathlib import Path
+
+
+def empty_data() -> Dict:
+    return {
+        "appointments": [],
+        "bookings": [],
+        "pending_confirmations": []
+    }
+
+
+class StorageBackend:
+    """
+    Interface every backend implements. load_all/save_all keep the whole
+    document API working; the row-level methods are what booking uses so that
+    concurrent sessions cannot overwrite each other's changes.
+    """
+
+    def __init__(self):
+        # change_token before -> after, for writes made by this process
+        self._local_writes: "OrderedDict[Any, Any]" = OrderedDict()
+        self._local_writes_lock = threading.Lock()
+
+    def _record_local_write(self, before: Any, after: Any) -> None:
+        if before is None or after is None or before == after:
+            return
+        with self._local_writes_lock:
+            self._local_writes[before] = after
+            while len(self._local_writes) > 1000:
+                self._local_writes.popitem(last=False)
+
+    def follow_local_writes(self, token: Any) -> Any:
+        """The change_token that this process's own writes have moved token to."""
+        with self._local_writes_lock:
+            seen = set()
+            while token in self._local_writes and token not in seen:
+                seen.add(token)
+                token = self._local_writes[token]
+        return token
+
+    def load_all(self) -> Dict:
+        raise NotImplementedError
+
+    def save_all(self, data: Dict) -> None:
+        raise NotImplementedError
+
+    def get_appointment(self, appointment_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def add_pending_confirmation(self, confirmation: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get_pending_confirmation(self, token: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set_pending_status(self, token: str, from_status: str, to_status: str) -> bool:
+        """Atomically move a confirmation from one status to another."""
+        raise NotImplementedError
+
+    def reserve_slot(self, confirmation: Dict[str, Any]) -> bool:
+        """
+        Compare-and-set: put a hold on the slot until the confirmation
+        expires and store the confirmation, but only if the slot is available
+        and not held by anyone else. Exactly one concurrent caller wins.
+        """
+        raise NotImplementedError
+
+    def release_hold(self, appointment_id: str, token: str) -> bool:
+        """Drop the hold a confirmation has on its slot."""
+        raise NotImplementedError
+
+    def confirm_booking(self, token: str, booking: Dict[str, Any]) -> bool:
+        """
+        In one transaction: mark the pending confirmation as confirmed, claim
+        the slot (only if still available) and store the booking.
+        Returns False and changes nothing if any condition fails.
+        """
+        raise NotImplementedError
+
+    def get_booking(self, booking_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def cancel_booking(self, booking_id: str, cancelled_at: str) -> Optional[Dict[str, Any]]:
+        """Atomically cancel a confirmed booking and release its slot."""
+        raise NotImplementedError
+
+    def expire_pending_confirmations(self, now: str) -> int:
+        """Expire due confirmations and release the holds they had."""
+        raise NotImplementedError
+
+    def change_token(self) -> Any:
+        """
+        Cheap value that changes with every write, so in-memory indexes know
+        to reload; follow_local_writes tells this process's own writes apart.
+        None means no way to tell.
+        """
+        return None
+
+
+def hold_is_active(appointment: Dict[str, Any], now: str) -> bool:
+    held_until = appointment.get("held_until")
+    return bool(held_until) and datetime.fromisoformat(held_until) > datetime.fromisoformat(now)
+
+
+class JsonFileBackend(StorageBackend):
+    """The original single JSON document, guarded by a process-local lock."""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = Path(path)
+        self._lock = threading.RLock()
+
+    def load_all(self) -> Dict:
+        with self._lock:
+            try:
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+
+            except FileNotFoundError:
+                initial_data = empty_data()
+                self.save_all(initial_data)
+                return initial_data
+
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON in data file: {str(e)}")
+
+    def save_all(self, data: Dict) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            before = self.change_token()
+            with open(self.path, 'w') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            self._record_local_write(before, self.change_token())
+
+    def change_token(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _find(self, items: List[Dict], key: str, value: str) -> Optional[Dict]:
+        for item in items:
+            if item[key] == value:
+                return item
+        return None
+
+    def get_appointment(self, appointment_id):
+        return self._find(self.load_all()["appointments"], "id", appointment_id)
+
+    def add_pending_confirmation(self, confirmation):
+        with self._lock:
+            data = self.load_all()
+            data["pending_confirmations"].append(confirmation)
+            self.save_all(data)
+
+    def get_pending_confirmation(self, token):
+        return self._find(self.load_all()["pending_confirmations"], "token", token)
+
+    def set_pending_status(self, token, from_status, to_status):
+        with self._lock:
+            data = self.load_all()
+            conf = self._find(data["pending_confirmations"], "token", token)
+            if not conf or conf["status"] != from_status:
+                return False
+            conf["status"] = to_status
+            self.save_all(data)
+            return True
+
+    def reserve_slot(self, confirmation):
+        with self._lock:
+            data = self.load_all()
+            apt = self._find(data["appointments"], "id", confirmation["appointment_id"])
+            if not apt or not apt["available"] or hold_is_active(apt, confirmation["created_at"]):
+                return False
+            apt["held_by"] = confirmation["token"]
+            apt["held_until"] = confirmation["expires_at"]
+            data["pending_confirmations"].append(confirmation)
+            self.save_all(data)
+            return True
+
+    def release_hold(self, appointment_id, token):
+        with self._lock:
+            data = self.load_all()
+            apt = self._find(data["appointments"], "id", appointment_id)
+            if not apt or apt.get("held_by") != token:
+                return False
+            apt.pop("held_by", None)
+            apt.pop("held_until", None)
+            self.save_all(data)
+            return True
+
+    def confirm_booking(self, token, booking):
+        with self._lock:
+            data = self.load_all()
+            conf = self._find(data["pending_confirmations"], "token", token)
+            apt = self._find(data["appointments"], "id", booking["appointment_id"])
+            if not conf or conf["status"] != "pending" or not apt or not apt["available"]:
+                return False
+            if apt.get("held_by") not in (None, token) and hold_is_active(apt, booking["booked_at"]):
+                return False
+            apt["available"] = False
+            apt.pop("held_by", None)
+            apt.pop("held_until", None)
+            conf["status"] = "confirmed"
+            conf["booking_id"] = booking["booking_id"]
+            data["bookings"].append(booking)
+            self.save_all(data)
+            return True
+
+    def get_booking(self, booking_id):
+        return self._find(self.load_all()["bookings"], "booking_id", booking_id)
+
+    def cancel_booking(self, booking_id, cancelled_at):
+        with self._lock:
+            data = self.load_all()
+            booking = self._find(data["bookings"], "booking_id", booking_id)
+            if not booking or booking["status"] != "confirmed":
+                return None
+            apt = self._find(data["appointments"], "id", booking["appointment_id"])
+            if apt:
+                apt["available"] = True
+            booking["status"] = "cancelled"
+            booking["cancelled_at"] = cancelled_at
+            self.save_all(data)
+            return booking
+
+    def expire_pending_confirmations(self, now):
+        with self._lock:
+            data = self.load_all()
+            cleaned_count = 0
+            for conf in data["pending_confirmations"]:
+                if conf["status"] == "pending" and datetime.fromisoformat(conf["expires_at"]) < datetime.fromisoformat(now):
+                    conf["status"] = "expired"
+                    cleaned_count += 1
+            released = 0
+            for apt in data["appointments"]:
+                if apt.get("held_until") and not hold_is_active(apt, now):
+                    apt.pop("held_by", None)
+                    apt.pop("held_until", None)
+                    released += 1
+            if cleaned_count > 0 or released > 0:
+                self.save_all(data)
+            return cleaned_count
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    available INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    held_by TEXT,
+    held_until TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments (date, time);
+
+CREATE TABLE IF NOT EXISTS pending_confirmations (
+    token TEXT PRIMARY KEY,
+    appointment_id TEXT NOT NULL,
+    user_data TEXT NOT NULL,
+    appointment_details TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    booking_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pending_status ON pending_confirmations (status, expires_at);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id TEXT PRIMARY KEY,
+    appointment_id TEXT NOT NULL,
+    user_data TEXT NOT NULL,
+    appointment_details TEXT NOT NULL,
+    booked_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cancelled_at TEXT
+);
+
+-- Bumped by every write transaction, read as the change token
+CREATE TABLE IF NOT EXISTS change_counter (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO change_counter (id, version) VALUES (1, 0);
+"""
+
+JSON_COLUMNS = ("user_data", "appointment_details")
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    SQLite in WAL mode. Every write is a short row-level transaction and slot
+    claims are conditional updates, so exactly one writer can take a slot.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # Separate connection for change_token, usable from any thread
+        self._monitor = None
+        self._monitor_lock = threading.Lock()
+        conn = self._connect()
+        conn.executescript(SQLITE_SCHEMA)
+
+        # Databases created before slot holds existed
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(appointments)")}
+        for column in ("held_by", "held_until"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE appointments ADD COLUMN {column} TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            # Under the write lock, so before -> before + 1 is exactly this commit
+            before = conn.execute("SELECT version FROM change_counter WHERE id = 1").fetchone()[0]
+            conn.execute("UPDATE change_counter SET version = version + 1 WHERE id = 1")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._record_local_write(before, before + 1)
+
+    @staticmethod
+    def _row_to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        item = dict(row)
+        for column in JSON_COLUMNS:
+            if column in item:
+                item[column] = json.loads(item[column])
+        if "available" in item:
+            item["available"] = bool(item["available"])
+        return {key: value for key, value in item.items() if value is not None}
+
+    def change_token(self):
+        with self._monitor_lock:
+            if self._monitor is None:
+                self._monitor = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            row = self._monitor.execute("SELECT version FROM change_counter WHERE id = 1").fetchone()
+            return row[0] if row else None
+
+    def is_empty(self) -> bool:
+        row = self._connect().execute("SELECT COUNT(*) FROM appointments").fetchone()
+        return row[0] == 0
+
+    def load_all(self) -> Dict:
+        conn = self._connect()
+        return {
+            "appointments": [
+                self._row_to_dict(row) for row in
+                conn.execute("SELECT id, date, time, available, type, held_by, held_until FROM appointments ORDER BY date, time")
+            ],
+            "bookings": [
+                self._row_to_dict(row) for row in
+                conn.execute("SELECT * FROM bookings ORDER BY booked_at")
+            ],
+            "pending_confirmations": [
+                self._row_to_dict(row) for row in
+                conn.execute("SELECT * FROM pending_confirmations ORDER BY created_at")
+            ],
+        }
+
+    def save_all(self, data: Dict) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM appointments")
+            conn.execute("DELETE FROM pending_confirmations")
+            conn.execute("DELETE FROM bookings")
+            conn.executemany(
+                "INSERT INTO appointments (id, date, time, available, type, held_by, held_until) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        apt["id"], apt["date"], apt["time"], int(apt["available"]), apt["type"],
+                        apt.get("held_by"), apt.get("held_until")
+                    )
+                    for apt in data.get("appointments", [])
+                ]
+            )
+            for conf in data.get("pending_confirmations", []):
+                self._insert_pending(conn, conf)
+            for booking in data.get("bookings", []):
+                self._insert_booking(conn, booking)
+
+    def _insert_pending(self, conn: sqlite3.Connection, conf: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT INTO pending_confirmations "
+            "(token, appointment_id, user_data, appointment_details, created_at, expires_at, status, booking_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                conf["token"], conf["appointment_id"],
+                json.dumps(conf["user_data"], ensure_ascii=False),
+                json.dumps(conf["appointment_details"], ensure_ascii=False),
+                conf["created_at"], conf["expires_at"], conf["status"], conf.get("booking_id")
+            )
+        )
+
+    def _insert_booking(self, conn: sqlite3.Connection, booking: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT INTO bookings "
+            "(booking_id, appointment_id, user_data, appointment_details, booked_at, status, cancelled_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                booking["booking_id"], booking["appointment_id"],
+                json.dumps(booking["user_data"], ensure_ascii=False),
+                json.dumps(booking["appointment_details"], ensure_ascii=False),
+                booking["booked_at"], booking["status"], booking.get("cancelled_at")
+            )
+        )
+
+    def get_appointment(self, appointment_id):
+        row = self._connect().execute(
+            "SELECT id, date, time, available, type, held_by, held_until FROM appointments WHERE id = ?",
+            (appointment_id,)
+        ).fetchone()
+        return self._row_to_dict(row)
+
+    def add_pending_confirmation(self, confirmation):
+        with self._transaction() as conn:
+            self._insert_pending(conn, confirmation)
+
+    def get_pending_confirmation(self, token):
+        row = self._connect().execute(
+            "SELECT * FROM pending_confirmations WHERE token = ?", (token,)
+        ).fetchone()
+        return self._row_to_dict(row)
+
+    def set_pending_status(self, token, from_status, to_status):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE pending_confirmations SET status = ? WHERE token = ? AND status = ?",
+                (to_status, token, from_status)
+            )
+            return cursor.rowcount == 1
+
+    def reserve_slot(self, confirmation):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE appointments SET held_by = ?, held_until = ? "
+                "WHERE id = ? AND available = 1 AND (held_until IS NULL OR held_until <= ?)",
+                (
+                    confirmation["token"], confirmation["expires_at"],
+                    confirmation["appointment_id"], confirmation["created_at"]
+                )
+            )
+            if cursor.rowcount != 1:
+                return False
+            self._insert_pending(conn, confirmation)
+            return True
+
+    def release_hold(self, appointment_id, token):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE appointments SET held_by = NULL, held_until = NULL WHERE id = ? AND held_by = ?",
+                (appointment_id, token)
+            )
+            return cursor.rowcount == 1
+
+    def confirm_booking(self, token, booking):
+        # Raising inside the transaction rolls back the partial update.
+        class _Conflict(Exception):
+            pass
+
+        try:
+            with self._transaction() as conn:
+                cursor = conn.execute(
+                    "UPDATE pending_confirmations SET status = 'confirmed', booking_id = ? "
+                    "WHERE token = ? AND status = 'pending'",
+                    (booking["booking_id"], token)
+                )
+                if cursor.rowcount != 1:
+                    raise _Conflict()
+
+                cursor = conn.execute(
+                    "UPDATE appointments SET available = 0, held_by = NULL, held_until = NULL "
+                    "WHERE id = ? AND available = 1 "
+                    "AND (held_by IS NULL OR held_by = ? OR held_until <= ?)",
+                    (booking["appointment_id"], token, booking["booked_at"])
+                )
+                if cursor.rowcount != 1:
+                    raise _Conflict()
+
+                self._insert_booking(conn, booking)
+        except _Conflict:
+            return False
+        return True
+
+    def get_booking(self, booking_id):
+        row = self._connect().execute(
+            "SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)
+        ).fetchone()
+        return self._row_to_dict(row)
+
+    def cancel_booking(self, booking_id, cancelled_at):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE bookings SET status = 'cancelled', cancelled_at = ? "
+                "WHERE booking_id = ? AND status = 'confirmed'",
+                (cancelled_at, booking_id)
+            )
+            if cursor.rowcount != 1:
+                return None
+            row = conn.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+            conn.execute(
+                "UPDATE appointments SET available = 1 WHERE id = ?",
+                (row["appointment_id"],)
+            )
+            return self._row_to_dict(row)
+
+    def expire_pending_confirmations(self, now):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE pending_confirmations SET status = 'expired' "
+                "WHERE status = 'pending' AND expires_at < ?",
+                (now,)
+            )
+            conn.execute(
+                "UPDATE appointments SET held_by = NULL, held_until = NULL "
+                "WHERE held_until IS NOT NULL AND held_until <= ?",
+                (now,)
+            )
+            return cursor.rowcount
+
+
+def migrate_json_to_sqlite(json_path: Path, db_path: Path, overwrite: bool = False) -> Dict[str, int]:
+    """One-shot import of an existing data.json into a SQLite database."""
+    backend = SQLiteBackend(db_path)
+
+    if not backend.is_empty() and not overwrite:
+        raise ValueError(f"SQLite database {db_path} already contains data")
+
+    data = JsonFileBackend(json_path).load_all()
+    backend.save_all(data)
+
+    return {
+        "appointments": len(data.get("appointments", [])),
+        "bookings": len(data.get("bookings", [])),
+        "pending_confirmations": len(data.get("pending_confirmations", [])),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    source = Path(__file__).parent.parent / "data" / "data.json"
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else source.with_suffix(".db")
+
+    counts = migrate_json_to_sqlite(source, target)
+    print(f"[MIGRATION] Imported {counts} into {target}")
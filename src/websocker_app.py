@@ -7,23 +7,69 @@ import sys
 import os
 import hmac
 import hashlib
+import uuid
+import copy
 
 sys.path.insert(0, os.path.dirname(__file__))
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Header, HTTPException, Request
-from fastapi.responses import FileResponse
-from typing import Dict
+from fastapi.responses import FileResponse, HTMLResponse
+from typing import Dict, Optional
+import asyncio
 from dotenv import load_dotenv
 import json
 
-from elevenlabs_integration.voice_service import stream_tts_websocket
-from openai_integration.agent import AppointmentAgent
+from elevenlabs_integration.voice_service import stream_tts_websocket, get_tts_metrics, ELEVENLABS_VOICE_ID
+from elevenlabs_integration.tts_pool import get_tts_pool, close_tts_pool
+from elevenlabs_integration.http_client import close_http_client
+from elevenlabs_integration.stt_stream import StreamingTranscriber
+from elevenlabs_integration.tts_cache import get_tts_cache, preload_phrases, TTS_CACHE_ENABLED, TTS_CACHE_PRELOAD
+from openai_integration.agent import AppointmentAgent, close_openai_client
+from openai_integration.router import normalize_utterance
+from tools.email_outbox import get_email_outbox
+from tools.email_service import close_smtp_pool
+from tools.booking import run_expiry_sweeper, book_appointment
+from tools import execute_function_call, tool_registry
+from sessions import get_session_store, close_session_store
 
 load_dotenv()
 
 app = FastAPI(title="Voice Assistant WebSocket Server")
 
-active_agents: Dict[int, AppointmentAgent] = {}
+# Agents of the connections this worker serves; their state lives in the session store
+active_agents: Dict[str, AppointmentAgent] = {}
+background_tasks = []
+
+# Turns started on a stable partial transcript, and how they ended
+speculation_stats = {"started": 0, "confirmed": 0, "discarded": 0}
+
+# Turns cut short by the caller, and the generation that was not paid for
+interruption_stats = {
+    "interrupts": 0,
+    "completed_turns": 0,
+    "completed_chars": 0,
+    "chars_generated_before_interrupt": 0,
+    "audio_bytes_sent_before_interrupt": 0,
+    "estimated_chars_avoided": 0,
+}
+
+BARGE_IN_ENABLED = os.getenv("BARGE_IN_ENABLED", "true").lower() == "true"
+
+# Voice used for replies; the phrase cache is keyed on it
+TTS_MODEL = "eleven_turbo_v2"
+TTS_VOICE_SETTINGS = {"stability": 0.5, "similarity_boost": 0.8}
+
+# Pre-rendered clips played when tools are still running after FILLER_DELAY_MS
+FILLER_ENABLED = os.getenv("FILLER_ENABLED", "true").lower() == "true"
+FILLER_DELAY_MS = int(os.getenv("FILLER_DELAY_MS", 350))
+FILLER_PHRASES = [
+    phrase.strip() for phrase in os.getenv(
+        "FILLER_PHRASES",
+        "One moment please.|Checking now, please wait."
+    ).split("|") if phrase.strip()
+]
+
+filler_stats = {"played": 0, "not_needed": 0, "unavailable": 0}
 
 ELEVENLABS_WEBHOOK_SECRET = os.getenv("ELEVENLABS_WEBHOOK_SECRET")
 
@@ -42,6 +88,47 @@ def verify_elevenlabs_signature(payload: bytes, signature: str) -> bool:
     return hmac.compare_digest(expected_signature, signature)
 
 
+@app.on_event("startup")
+async def startup():
+    get_email_outbox().ensure_workers()
+    background_tasks.append(asyncio.create_task(run_expiry_sweeper()))
+    
+    try:
+        await get_tts_pool().warm_up(ELEVENLABS_VOICE_ID, TTS_MODEL)
+    except Exception as e:
+        print(f"[WARN] Could not warm up TTS pool: {e}")
+    
+    if TTS_CACHE_ENABLED:
+        background_tasks.append(asyncio.create_task(preload_tts_cache()))
+
+
+async def preload_tts_cache():
+    try:
+        added = await preload_phrases(
+            get_tts_cache(),
+            ELEVENLABS_VOICE_ID,
+            TTS_MODEL,
+            TTS_VOICE_SETTINGS,
+            TTS_CACHE_PRELOAD + [p for p in FILLER_PHRASES if p not in TTS_CACHE_PRELOAD]
+        )
+        print(f"[INFO] TTS phrase cache ready ({added} phrases synthesized)")
+    except Exception as e:
+        print(f"[WARN] Could not preload TTS phrase cache: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await close_openai_client()
+    await close_tts_pool()
+    await close_http_client()
+    await get_email_outbox().stop()
+    await close_smtp_pool()
+    await close_session_store()
+    tool_registry.shutdown()
+
+
 @app.get("/")
 async def get_homepage():
     """MUST be async - FastAPI requirement"""
@@ -49,49 +136,288 @@ async def get_homepage():
     return FileResponse(html_path)
 
 
+async def load_agent(session_id: Optional[str]) -> tuple:
+    """The agent for a session, restored from the session store when it exists."""
+    session_store = get_session_store()
+
+    if session_id:
+        state = await session_store.load(session_id)
+        if state is not None:
+            print(f"[INFO] Resuming session: {session_id}")
+            return session_id, AppointmentAgent.from_state(state)
+
+    return session_id or uuid.uuid4().hex, AppointmentAgent()
+
+
+class VoiceSession:
+    """
+    One WebSocket connection: the agent, the turn in flight and, once the
+    client sends audio, the streaming transcriber. Turns run as tasks so the
+    receive loop keeps reading frames while the assistant answers, and a new
+    utterance or an interrupt message can cancel the turn mid-stream.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str, agent: AppointmentAgent):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.agent = agent
+        self.session_store = get_session_store()
+        self.transcriber: Optional[StreamingTranscriber] = None
+        self.turn_task: Optional[asyncio.Task] = None
+        self.turn_text: Optional[str] = None
+        # Set while the current turn was started on a stable partial
+        self.speculative_snapshot: Optional[Dict] = None
+        self.stateful_calls_at_start = 0
+        self.turn_chars = 0
+        self.turn_audio_bytes = 0
+        self.answer_started = False
+        self.fillers_played = 0
+
+    async def send_json(self, payload: Dict):
+        await self.websocket.send_text(json.dumps(payload))
+
+    async def run_turn(self, user_text: str):
+        print(f"[INFO] User said: {user_text}")
+        
+        await self.send_json({
+            "type": "status",
+            "message": "Processing your request..."
+        })
+        
+        response_parts = []
+        self.turn_chars = 0
+        self.turn_audio_bytes = 0
+        self.answer_started = False
+        filler_task = None
+        
+        async def on_tool_calls(tool_calls, content):
+            nonlocal filler_task
+            # If the model already said something, that covers the wait
+            if FILLER_ENABLED and TTS_CACHE_ENABLED and not content.strip():
+                filler_task = asyncio.create_task(self.play_filler())
+        
+        stream = self.agent.stream_message(user_text, on_tool_calls)
+        
+        async def audio_callback(audio_chunk: bytes):
+            self.turn_audio_bytes += len(audio_chunk)
+            await self.websocket.send_bytes(audio_chunk)
+        
+        async def text_generator():
+            # Feed LLM deltas to TTS and to the client as they arrive
+            async for delta in stream:
+                self.answer_started = True
+                response_parts.append(delta)
+                self.turn_chars += len(delta)
+                await self.send_json({
+                    "type": "assistant_message",
+                    "text": delta,
+                    "delta": True
+                })
+                yield delta
+        
+        try:
+            await stream_tts_websocket(
+                text_generator(),
+                audio_callback,
+                model=TTS_MODEL,
+                **TTS_VOICE_SETTINGS
+            )
+        finally:
+            # On cancellation this stops the completion and repairs the history
+            await stream.aclose()
+            if filler_task is not None and not filler_task.done():
+                filler_task.cancel()
+        
+        interruption_stats["completed_turns"] += 1
+        interruption_stats["completed_chars"] += self.turn_chars
+        
+        full_response = "".join(response_parts)
+        print(f"[INFO] OpenAI response: {full_response[:100]}...")
+        
+        await self.send_json({
+            "type": "assistant_message",
+            "text": full_response,
+            "final": True
+        })
+        
+        # Any worker can continue the session from here
+        await self.session_store.save(self.session_id, self.agent.to_state())
+        
+        print(f"[INFO] Audio streaming complete")
+
+    async def play_filler(self):
+        """
+        Once tools have run for FILLER_DELAY_MS without an answer, send a
+        cached filler clip. The answer's audio queues behind it on the client,
+        so playback goes straight from the filler into the reply.
+        """
+        await asyncio.sleep(FILLER_DELAY_MS / 1000)
+        if self.answer_started:
+            filler_stats["not_needed"] += 1
+            return
+        
+        phrase = FILLER_PHRASES[self.fillers_played % len(FILLER_PHRASES)]
+        audio = await get_tts_cache().get_async(phrase, ELEVENLABS_VOICE_ID, TTS_MODEL, TTS_VOICE_SETTINGS)
+        if audio is None:
+            filler_stats["unavailable"] += 1
+            return
+        if self.answer_started:
+            filler_stats["not_needed"] += 1
+            return
+        
+        self.fillers_played += 1
+        filler_stats["played"] += 1
+        await self.websocket.send_bytes(audio)
+        await self.send_json({"type": "filler", "text": phrase})
+
+    async def _run_after(self, previous: Optional[asyncio.Task], user_text: str):
+        # Utterances are answered in order
+        if previous is not None and not previous.done():
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await self.run_turn(user_text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Turn failed: {type(e).__name__}: {e}")
+
+    def start_turn(self, user_text: str, speculative: bool = False):
+        self.speculative_snapshot = copy.deepcopy(self.agent.to_state()) if speculative else None
+        self.stateful_calls_at_start = self.agent.stateful_calls
+        self.turn_text = user_text
+        self.turn_task = asyncio.create_task(self._run_after(self.turn_task, user_text))
+
+    def _turn_in_flight(self) -> bool:
+        return self.turn_task is not None and not self.turn_task.done()
+
+    async def interrupt(self, reason: str):
+        """Cancel the turn in flight and tell the client to drop queued audio."""
+        if self.speculative_snapshot is not None:
+            # The caller kept talking after the pause the turn was started on
+            snapshot, self.speculative_snapshot = self.speculative_snapshot, None
+            if self.agent.stateful_calls == self.stateful_calls_at_start:
+                speculation_stats["discarded"] += 1
+                await self._discard_turn(snapshot)
+                return
+        
+        # Audio of a finished turn may still be playing on the client
+        await self.send_json({"type": "flush_audio", "reason": reason})
+        
+        if not self._turn_in_flight():
+            return
+        
+        task = self.turn_task
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # A transcript may have started the next turn while we waited
+        if self.turn_task is task:
+            self.turn_task = None
+        
+        completed = interruption_stats["completed_turns"]
+        average_chars = interruption_stats["completed_chars"] / completed if completed else 0
+        interruption_stats["interrupts"] += 1
+        interruption_stats["chars_generated_before_interrupt"] += self.turn_chars
+        interruption_stats["audio_bytes_sent_before_interrupt"] += self.turn_audio_bytes
+        interruption_stats["estimated_chars_avoided"] += int(max(0, average_chars - self.turn_chars))
+        print(f"[INFO] Turn interrupted ({reason}) after {self.turn_chars} chars")
+        
+        await self.session_store.save(self.session_id, self.agent.to_state())
+
+    async def on_transcript(self, event: Dict):
+        if event["type"] == "speech_start":
+            if BARGE_IN_ENABLED:
+                await self.interrupt("barge_in")
+            return
+
+        if event["type"] == "partial":
+            await self.send_json({"type": "transcript", "text": event["text"], "final": False})
+            return
+
+        if event["type"] == "stable_partial":
+            if not self._turn_in_flight():
+                speculation_stats["started"] += 1
+                self.start_turn(event["text"], speculative=True)
+            return
+
+        final_text = event["text"]
+        await self.send_json({"type": "transcript", "text": final_text, "final": True})
+
+        if self.speculative_snapshot is not None:
+            snapshot, self.speculative_snapshot = self.speculative_snapshot, None
+
+            if normalize_utterance(final_text) == normalize_utterance(self.turn_text):
+                # The turn already under way answers exactly this
+                speculation_stats["confirmed"] += 1
+                return
+
+            if self.agent.stateful_calls == self.stateful_calls_at_start:
+                speculation_stats["discarded"] += 1
+                await self._discard_turn(snapshot)
+
+        if self._turn_in_flight():
+            await self.interrupt("new_utterance")
+        self.start_turn(final_text)
+
+    async def _discard_turn(self, snapshot: Dict):
+        """Throw away a speculative turn the final transcript did not match."""
+        task = self.turn_task
+        if self._turn_in_flight():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        # A transcript may have started the next turn while we waited
+        if self.turn_task is task:
+            self.turn_task = None
+        self.agent.restore_state(snapshot)
+        await self.send_json({"type": "flush_audio"})
+
+    async def feed_audio(self, frame: bytes):
+        if self.transcriber is None:
+            self.transcriber = StreamingTranscriber(self.on_transcript)
+            await self.transcriber.start()
+        await self.transcriber.feed(frame)
+
+    async def close(self):
+        if self.turn_task is not None:
+            self.turn_task.cancel()
+        if self.transcriber is not None:
+            await self.transcriber.close()
+
+
 @app.websocket("/websocket")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, session_id: Optional[str] = None):
     await websocket.accept()
     
-    session_id = id(websocket)
-    agent = AppointmentAgent()
+    session_id, agent = await load_agent(session_id)
     active_agents[session_id] = agent
+    session = VoiceSession(websocket, session_id, agent)
     
     print(f"[INFO] New WebSocket connection: {session_id}")
     
+    await session.send_json({
+        "type": "session",
+        "session_id": session_id
+    })
+    
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            frame = await websocket.receive()
+            
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            
+            # Binary frames are 16 kHz mono PCM16 from the microphone
+            if frame.get("bytes") is not None:
+                await session.feed_audio(frame["bytes"])
+                continue
+            
+            message = json.loads(frame["text"])
             
             if message.get("type") == "user_message":
-                user_text = message.get("text", "")
-                print(f"[INFO] User said: {user_text}")
-                
-                await websocket.send_text(json.dumps({
-                    "type": "status",
-                    "message": "Processing your request..."
-                }))
-                
-                full_response = await agent.process_message(user_text)
-                
-                print(f"[INFO] OpenAI response: {full_response[:100]}...")
-                
-                await websocket.send_text(json.dumps({
-                    "type": "assistant_message",
-                    "text": full_response
-                }))
-                
-                async def audio_callback(audio_chunk: bytes):
-                    await websocket.send_bytes(audio_chunk)
-                
-                async def text_generator():
-                    yield full_response
-                
-                # Stream TTS - MUST await
-                await stream_tts_websocket(text_generator(), audio_callback)
-                
-                print(f"[INFO] Audio streaming complete")
+                await session.interrupt("new_utterance")
+                session.start_turn(message.get("text", ""))
+            
+            elif message.get("type") == "interrupt":
+                await session.interrupt("client")
                 
     except WebSocketDisconnect:
         print(f"[INFO] WebSocket disconnected: {session_id}")
@@ -100,12 +426,48 @@ async def websocket_endpoint(websocket: WebSocket):
         import traceback
         traceback.print_exc()
     finally:
-        # Cleanup - sync operation
-        if session_id in active_agents:
+        await session.close()
+        # The stored state stays until its TTL so the caller can reconnect
+        if active_agents.get(session_id) is agent:
             del active_agents[session_id]
         print(f"[INFO] Cleaned up session: {session_id}")
 
 
+CONFIRM_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>KVR Munich - Appointment</title></head>
+<body style="font-family: sans-serif; max-width: 600px; margin: 50px auto; text-align: center;">
+    <h1>{title}</h1>
+    <p>{message}</p>
+</body>
+</html>"""
+
+
+@app.get("/confirm", response_class=HTMLResponse)
+async def confirm_appointment(token: str):
+    """
+    Target of the link in the confirmation email. Idempotent: clicking the
+    link again shows the same booking. The booking email goes through the
+    outbox, so this returns as soon as the slot is booked.
+    """
+    result = await book_appointment(token)
+    
+    if result["status"] != "success":
+        return HTMLResponse(
+            CONFIRM_PAGE.format(title="Confirmation failed", message=result["message"]),
+            status_code=410 if result.get("reason") == "expired" else 400
+        )
+    
+    booking = result["booking"]
+    details = booking["appointment_details"]
+    message = (
+        f"Your appointment on {details['date']} at {details['time']} is confirmed. "
+        f"Booking ID: {booking['booking_id']}. A confirmation email is on its way."
+    )
+    
+    return HTMLResponse(CONFIRM_PAGE.format(title="Appointment confirmed", message=message))
+
+
 @app.post("/webhook")
 async def elevenlabs_webhook(
     request: Request,
@@ -127,9 +489,7 @@ async def elevenlabs_webhook(
         tool_name = data.get("tool_name")
         parameters = data.get("parameters", {})
         
-        from tools import execute_function_call
-        # If this is sync, no await needed
-        result = execute_function_call(tool_name, parameters)
+        result = await execute_function_call(tool_name, parameters)
         
         return {"success": True, "result": result}
     
@@ -141,7 +501,12 @@ async def health_check():
     
     return {
         "status": "healthy",
-        "active_connections": len(active_agents)
+        "active_connections": len(active_agents),
+        "stored_sessions": await get_session_store().count(),
+        "tts_pool": get_tts_metrics(),
+        "speculative_turns": speculation_stats,
+        "interruptions": interruption_stats,
+        "fillers": filler_stats
     }
 
 